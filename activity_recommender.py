@@ -1,17 +1,18 @@
 import streamlit as st
 from database import supabase_client
-import openai
-import os
-from datetime import datetime
-from dotenv import load_dotenv  # Import this
+from parallel import gather, submit
+from write_buffer import get_write_buffer
+from change_feed import live_query
+from llm_gateway import get_llm_gateway
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone
 
-load_dotenv()  # Add this line to load variables from .env
+RECOMMENDATION_MODEL = "gpt-4o-mini"
+RECOMMENDATION_SYSTEM_PROMPT = "You are an AI trained to recommend mental health activities, taking into account professional input."
 
-
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
-
-def get_ai_recommendation(user_data, recent_moods, professional_input):
+def recommendation_request(user_data, recent_moods, professional_input):
     prompt = f"""
     Based on the following user data, recent moods, and professional input, suggest 3 activities that could help improve the user's mental health:
     User Data: {user_data}
@@ -32,44 +33,122 @@ def get_ai_recommendation(user_data, recent_moods, professional_input):
     Benefit: [how it can help]
     """
     
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are an AI trained to recommend mental health activities, taking into account professional input."},
+    return {
+        'model': RECOMMENDATION_MODEL,
+        'messages': [
+            {"role": "system", "content": RECOMMENDATION_SYSTEM_PROMPT},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=300
-    )
-    
-    return response.choices[0].message.content
+        'max_tokens': 300
+    }
+
+def get_ai_recommendation(user_data, recent_moods, professional_input, user_id=None):
+    return get_llm_gateway().chat(**recommendation_request(user_data, recent_moods, professional_input), user_id=user_id)
+
+def recommendation_input_hash(user_data, recent_moods, professional_input):
+    payload = json.dumps({
+        'user': user_data,
+        'moods': recent_moods,
+        'professional_input': professional_input
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def get_stored_recommendation(user_id):
+    try:
+        stored = supabase_client.table('recommendations').select('input_hash', 'recommendation').eq('user_id', user_id).limit(1).execute()
+        if stored.data:
+            return stored.data[0]
+    except Exception as e:
+        print(f"Error reading stored recommendation: {str(e)}")
+    return None
+
+def store_recommendation(user_id, input_hash, recommendation, inputs_as_of):
+    # inputs_as_of: when the moods and professional input behind this recommendation were read.
+    try:
+        supabase_client.table('recommendations').upsert({
+            'user_id': user_id,
+            'input_hash': input_hash,
+            'recommendation': recommendation,
+            'inputs_as_of': inputs_as_of,
+            'generated_at': datetime.now(timezone.utc).isoformat()
+        }).execute()
+        return True
+    except Exception as e:
+        print(f"Error storing recommendation: {str(e)}")
+        return False
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+def refresh_recommendation(user_id, user_data, recent_moods, professional_input, input_hash, inputs_as_of):
+    with _refreshing_lock:
+        if user_id in _refreshing:
+            return
+        _refreshing.add(user_id)
+    try:
+        recommendation = get_ai_recommendation(user_data, recent_moods, professional_input, user_id)
+        store_recommendation(user_id, input_hash, recommendation, inputs_as_of)
+    except Exception as e:
+        print(f"Error refreshing recommendation: {str(e)}")
+    finally:
+        with _refreshing_lock:
+            _refreshing.discard(user_id)
+
+def get_recommendation(user_id, user_data, recent_moods, professional_input):
+    # Normally precomputed by batch_recommendations.py; the page only generates one itself
+    # for a patient the batch job has not reached yet.
+    inputs_as_of = datetime.now(timezone.utc).isoformat()
+    input_hash = recommendation_input_hash(user_data, recent_moods, professional_input)
+    stored = get_stored_recommendation(user_id)
+    if stored is not None:
+        if stored['input_hash'] != input_hash:
+            # Inputs changed since it was generated: show it now, refresh in the background.
+            submit(refresh_recommendation, user_id, user_data, recent_moods, professional_input, input_hash, inputs_as_of)
+        return stored['recommendation']
+    recommendation = get_ai_recommendation(user_data, recent_moods, professional_input, user_id)
+    store_recommendation(user_id, input_hash, recommendation, inputs_as_of)
+    return recommendation
 
 def insert_activity(user_id, activity_name, description, benefit, status):
     try:
-        supabase_client.table('activities').insert({
+        # Buffered: durable locally at once, written to the database in the next batch
+        get_write_buffer().insert('activities', {
             'user_id': user_id,
             'activity_name': activity_name,
             'description': description,
             'benefit': benefit,
             'status': status,
-            'created_at': datetime.now().isoformat()
-        }).execute()
-        print('Activity inserted successfully')
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
         return True
     except Exception as e:
         print(f'Error inserting activity: {str(e)}')
         return False
 
 def get_user_activities(user_id):
-    return supabase_client.table('activities').select('*').eq('user_id', user_id).order('created_at', desc=True).execute()
+    activities = live_query(
+        f"activities:{user_id}", 'activities',
+        lambda: supabase_client.table('activities').select('*').eq('user_id', user_id).execute().data,
+        lambda activity: activity.get('user_id') == user_id
+    ).rows()
+    activities.sort(key=lambda activity: activity['created_at'], reverse=True)
+    # Include this process's buffered inserts and status changes (read-your-writes)
+    return get_write_buffer().merge_pending('activities', activities, user_id=user_id)
 
 def update_activity_status(activity_id, new_status):
     try:
-        supabase_client.table('activities').update({'status': new_status}).eq('id', activity_id).execute()
+        get_write_buffer().update('activities', activity_id, {'status': new_status})
         return True
     except Exception as e:
         st.error(f"Failed to update activity status: {str(e)}")
         return False
 
+def get_recent_moods(user_id, limit):
+    moods = supabase_client.table('mood_journal').select('mood', 'created_at', 'client_ref').eq('user_id', user_id).order('created_at', desc=True).limit(limit).execute()
+    merged = get_write_buffer().merge_pending('mood_journal', moods.data, limit=limit, user_id=user_id)
+    # Only the mood values feed the prompt and the recommendation cache key.
+    return [{'mood': entry['mood']} for entry in merged]
+
 def get_professional_input(user_id):
     professional_input = supabase_client.table('professional_inputs').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(1).execute()
     if professional_input.data:
@@ -79,8 +158,14 @@ def get_professional_input(user_id):
 def activity_recommendation_system(user_id):
     st.subheader("Activity Recommendations")
     
-    # Fetch user data
-    user_data_response = supabase_client.table('users').select('*').eq('id', user_id).execute()
+    # The page's four queries are independent, so issue them together
+    results = gather(
+        user=lambda: supabase_client.table('users').select('*').eq('id', user_id).execute(),
+        moods=lambda: get_recent_moods(user_id, 5),
+        professional_input=lambda: get_professional_input(user_id),
+        activities=lambda: get_user_activities(user_id),
+    )
+    user_data_response = results['user']
 
     if not user_data_response.data or len(user_data_response.data) != 1:
         st.warning('Unable to fetch user data or multiple users found. Please try again later.')
@@ -88,33 +173,32 @@ def activity_recommendation_system(user_id):
     
     user_data = user_data_response.data[0]  # Extract user data from the response
     
-    # Fetch recent moods
-    recent_moods_response = supabase_client.table('mood_journal').select('mood').eq('user_id', user_id).order('created_at', desc=True).limit(5).execute()
+    recent_moods = results['moods']
 
-    if not recent_moods_response.data:
+    if not recent_moods:
         st.warning('No recent mood data available. Please log your moods to get personalized recommendations.')
         return
     
-    recent_moods = recent_moods_response.data  # Get mood data
-    
-    # Fetch professional input
-    professional_input = get_professional_input(user_id)
+    professional_input = results['professional_input']
     
-    # Get AI recommendations
-    ai_recommendations = get_ai_recommendation(user_data, recent_moods, professional_input)
+    # Precomputed nightly by batch_recommendations.py; refreshed in the background when the inputs change
+    ai_recommendations = get_recommendation(user_id, user_data, recent_moods, professional_input)
     
     st.write("Based on your recent moods, profile, and professional input, here are some recommended activities:")
     st.write(ai_recommendations)
     
     # Display user's existing activities
     st.subheader("Your Activities")
-    activities = get_user_activities(user_id)
+    activities = results['activities']
     
-    if activities.data:
-        for activity in activities.data:
+    if activities:
+        for activity in activities:
             with st.expander(f"{activity['activity_name']} - {activity['status']}"):
                 st.write(f"Description: {activity['description']}")
                 st.write(f"Benefit: {activity['benefit']}")
+                if activity.get('id') is None:
+                    st.caption("Saving...")
+                    continue
                 new_status = st.selectbox("Update status", ["pending", "in_progress", "completed"], 
                                           index=["pending", "in_progress", "completed"].index(activity['status']),
                                           key=f"status_{activity['id']}")
@@ -1,12 +1,19 @@
 import streamlit as st
 from database import supabase_client
-from datetime import datetime, timedelta
+from stats import get_admin_statistics
+from directory import page_users, invalidate_directory, USER_PAGE_SIZE
+from tabs import render_tabs, tab_fragment, tab_cache, clear_tab_cache
+from query_trace import recent_reruns
+from profiler import retained_profiles, slow_threshold, PROFILE_DIR
+import metrics
+
+BULK_PAGE_SIZE = 200
 
 def admin_flow():
     st.title("Admin Dashboard")
     
-    tabs = ["User Management", "System Statistics", "Activity Log"]
-    icons = ["people", "graph-up", "clock-history"]
+    tabs = ["User Management", "System Statistics", "Activity Log", "Performance"]
+    icons = ["people", "graph-up", "clock-history", "speedometer"]
     
     st.markdown(
         f"""
@@ -18,25 +25,42 @@ def admin_flow():
         unsafe_allow_html=True
     )
     
-    tab1, tab2, tab3 = st.tabs(tabs)
-    
-    with tab1:
-        manage_users()
-    
-    with tab2:
-        display_statistics()
-    
-    with tab3:
-        display_activity_log()
+    render_tabs("admin", dict(zip(tabs, [manage_users, display_statistics, display_activity_log, display_performance])))
 
+@tab_fragment
 def manage_users():
     st.subheader("User Management")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
-    users = supabase_client.table('users').select('*').execute()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        role_filter = st.selectbox("Role", ["all", "patient", "professional", "admin"], key="user_filter_role")
+    with col2:
+        status_filter = st.selectbox("Status", ["all", "active", "inactive"], key="user_filter_status")
+    with col3:
+        email_filter = st.text_input("Email starts with", key="user_filter_email").strip()
+    bulk_mode = st.toggle("Bulk edit", key="user_bulk_mode")
+    page_size = BULK_PAGE_SIZE if bulk_mode else USER_PAGE_SIZE
     
-    if users.data:
-        for user in users.data:
+    # Cursor stack: one (created_at, id) cursor per page already visited; reset when the filters change.
+    filters = (role_filter, status_filter, email_filter, page_size)
+    if st.session_state.get('user_page_filters') != filters:
+        st.session_state.user_page_filters = filters
+        st.session_state.user_page_cursors = [None]
+    cursors = st.session_state.user_page_cursors
+    
+    users, next_cursor = page_users(
+        after=cursors[-1],
+        user_type=None if role_filter == "all" else role_filter,
+        status=None if status_filter == "all" else status_filter,
+        email_prefix=email_filter or None,
+        limit=page_size
+    )
+    
+    if users and bulk_mode:
+        bulk_edit_users(users, page=len(cursors))
+    elif users:
+        for user in users:
             with st.expander(f"User: {user['email']}"):
                 col1, col2, col3 = st.columns(3)
                 with col1:
@@ -56,69 +80,214 @@ def manage_users():
     else:
         st.info("No users found in the system.")
     
+    col1, col2, col3 = st.columns([1, 2, 1])
+    if col1.button("Previous", key="user_page_prev", disabled=len(cursors) == 1):
+        cursors.pop()
+        st.rerun(scope="fragment")
+    col2.caption(f"Page {len(cursors)}")
+    if col3.button("Next", key="user_page_next", disabled=next_cursor is None):
+        cursors.append(next_cursor)
+        st.rerun(scope="fragment")
+    
     st.markdown('</div></div>', unsafe_allow_html=True)
 
 def update_user(user_id, status, user_type):
     supabase_client.table('users').update({'status': status, 'user_type': user_type}).eq('id', user_id).execute()
+    invalidate_directory(user_id)
 
+def bulk_edit_users(users, page):
+    import pandas as pd
+
+    original = pd.DataFrame([{
+        'selected': False,
+        'id': user['id'],
+        'email': user['email'],
+        'user_type': user['user_type'],
+        'status': user.get('status') or 'active',
+        'created_at': user['created_at']
+    } for user in users])
+    edited = st.data_editor(
+        original,
+        column_config={
+            'id': None,
+            'selected': st.column_config.CheckboxColumn("Select"),
+            'user_type': st.column_config.SelectboxColumn("User Type", options=["patient", "professional", "admin"], required=True),
+            'status': st.column_config.SelectboxColumn("Status", options=["active", "inactive"], required=True),
+        },
+        disabled=['email', 'created_at'],
+        hide_index=True,
+        use_container_width=True,
+        key=f"bulk_users_{page}"
+    )
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        bulk_status = st.selectbox("Set status of selected users", ["no change", "active", "inactive"], key="bulk_status")
+    with col2:
+        bulk_user_type = st.selectbox("Set user type of selected users", ["no change", "patient", "professional", "admin"], key="bulk_user_type")
+    
+    changes = collect_user_changes(original, edited, bulk_status, bulk_user_type)
+    if st.button(f"Apply {len(changes)} change(s)", key="bulk_apply", disabled=not changes, use_container_width=True):
+        results = bulk_update_users(changes)
+        emails = dict(zip(original['id'], original['email']))
+        failed = [result for result in results if not result['updated']]
+        if failed:
+            st.error(f"{len(failed)} of {len(results)} updates failed.")
+        else:
+            st.success(f"Updated {len(results)} user(s).")
+        st.dataframe([{'email': emails.get(result['id'], result['id']), 'updated': result['updated'], 'error': result['error']}
+                      for result in results], hide_index=True, use_container_width=True)
+
+def collect_user_changes(original, edited, bulk_status, bulk_user_type):
+    changes = []
+    for before, after in zip(original.to_dict('records'), edited.to_dict('records')):
+        status, user_type = after['status'], after['user_type']
+        if after['selected']:
+            status = status if bulk_status == "no change" else bulk_status
+            user_type = user_type if bulk_user_type == "no change" else bulk_user_type
+        change = {}
+        if status != before['status']:
+            change['status'] = status
+        if user_type != before['user_type']:
+            change['user_type'] = user_type
+        if change:
+            changes.append({'id': before['id'], **change})
+    return changes
+
+def bulk_update_users(changes):
+    # One RPC, one transaction; returns [{'id', 'updated', 'error'}] per requested row.
+    try:
+        results = supabase_client.rpc('bulk_update_users', {'changes': changes}).execute().data
+    except Exception as e:
+        results = [{'id': change['id'], 'updated': False, 'error': str(e)} for change in changes]
+    if any(result['updated'] for result in results):
+        invalidate_directory()
+    return results
+
+@tab_fragment
 def display_statistics():
     st.subheader("System Statistics")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
-    total_users = len(supabase_client.table('users').select('id').execute().data)
-    total_patients = len(supabase_client.table('users').select('id').eq('user_type', 'patient').execute().data)
-    total_professionals = len(supabase_client.table('users').select('id').eq('user_type', 'professional').execute().data)
-    total_reports = len(supabase_client.table('reports').select('id').execute().data)
-    total_appointments = len(supabase_client.table('appointments').select('id').execute().data)
+    statistics = get_admin_statistics()
+    users_by_type = statistics.get('users_by_type', {})
     
     col1, col2, col3 = st.columns(3)
-    col1.metric("Total Users", total_users)
-    col2.metric("Total Patients", total_patients)
-    col3.metric("Total Professionals", total_professionals)
+    col1.metric("Total Users", statistics.get('total_users', 0))
+    col2.metric("Total Patients", users_by_type.get('patient', 0))
+    col3.metric("Total Professionals", users_by_type.get('professional', 0))
     
     col4, col5 = st.columns(2)
-    col4.metric("Total Reports Generated", total_reports)
-    col5.metric("Total Appointments Scheduled", total_appointments)
+    col4.metric("Total Reports Generated", statistics.get('total_reports', 0))
+    col5.metric("Total Appointments Scheduled", statistics.get('total_appointments', 0))
     
     st.subheader("User Growth")
-    user_growth = get_user_growth()
-    st.line_chart(user_growth)
+    daily_signups = statistics.get('daily_signups')
+    if daily_signups is None:
+        st.info("Signup history is unavailable right now.")
+    elif daily_signups:
+        st.line_chart(daily_signups)
+    else:
+        st.info("No signups in the last 30 days.")
     
     st.subheader("Activity Distribution")
-    activity_distribution = get_activity_distribution()
-    st.bar_chart(activity_distribution)
+    st.bar_chart(statistics.get('activity_distribution', {}))
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
-def get_user_growth():
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=30)
+@tab_fragment
+def display_activity_log():
+    st.subheader("Recent Activity Log")
+    st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
-    user_growth = supabase_client.table('users').select('created_at').gte('created_at', start_date.isoformat()).lte('created_at', end_date.isoformat()).execute()
+    if st.button("Refresh", key="activity_log_refresh"):
+        clear_tab_cache("activity_log")
+    activities = tab_cache("activity_log", "recent", lambda: (
+        supabase_client.table('activities').select('*').order('created_at', desc=True).limit(50).execute().data
+    ))
     
-    growth_data = {}
-    for user in user_growth.data:
-        date = user['created_at'].split('T')[0]
-        growth_data[date] = growth_data.get(date, 0) + 1
+    if activities:
+        for activity in activities:
+            st.write(f"User ID: {activity['user_id']} - Activity: {activity['activity_name']} - Status: {activity['status']} - Created At: {activity['created_at']}")
+    else:
+        st.info("No recent activities found.")
     
-    return growth_data
+    st.markdown('</div></div>', unsafe_allow_html=True)
 
-def get_activity_distribution():
-    activities = supabase_client.table('activities').select('status', 'count').execute()
-    
-    distribution = {activity['status']: activity['count'] for activity in activities.data}
-    return distribution
+def _series_label(name, labels):
+    return name + (" {" + ", ".join(f"{key}={value}" for key, value in labels) + "}" if labels else "")
 
-def display_activity_log():
-    st.subheader("Recent Activity Log")
+@tab_fragment
+def display_performance():
+    st.subheader("Performance")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
+    st.caption("Figures cover this server process since it started. Prometheus scrapes the same metrics from /metrics on METRICS_PORT.")
+    st.button("Refresh", key="performance_refresh")
     
-    activities = supabase_client.table('activities').select('*').order('created_at', desc=True).limit(50).execute()
+    _, histograms = metrics.snapshot()
     
-    if activities.data:
-        for activity in activities.data:
-            st.write(f"User ID: {activity['user_id']} - Activity: {activity['activity_name']} - Status: {activity['status']} - Created At: {activity['created_at']}")
+    st.subheader("Queries by Table")
+    query_rows = []
+    for (name, labels), histogram in histograms.items():
+        if name == 'db_query_seconds' and histogram['count']:
+            labels = dict(labels)
+            query_rows.append({
+                'table': labels.get('table'),
+                'operation': labels.get('operation'),
+                'queries': histogram['count'],
+                'mean ms': round(1000 * histogram['sum'] / histogram['count'], 1),
+                'p50 ms (≤)': 1000 * metrics.quantile(histogram, 0.5),
+                'p95 ms (≤)': 1000 * metrics.quantile(histogram, 0.95),
+            })
+    if query_rows:
+        st.dataframe(sorted(query_rows, key=lambda row: row['queries'], reverse=True), use_container_width=True)
     else:
-        st.info("No recent activities found.")
+        st.info("No queries recorded yet.")
+    
+    st.subheader("Latency Histograms")
+    latency_series = {_series_label(name, labels): histogram for (name, labels), histogram in histograms.items()
+                      if name.endswith('_seconds') and histogram['count']}
+    if latency_series:
+        series = st.selectbox("Series", sorted(latency_series), key="performance_series")
+        histogram = latency_series[series]
+        bounds = [f"≤ {bound * 1000:g} ms" for bound in histogram['buckets']] + ["slower"]
+        st.bar_chart(dict(zip(bounds, histogram['counts'])))
+    
+    st.subheader("Recent Reruns")
+    reruns = recent_reruns()[::-1]
+    if reruns:
+        st.dataframe([{
+            'page': rerun['page'],
+            'queries': rerun['queries'],
+            'query ms': round(1000 * rerun['query_seconds'], 1),
+            'render ms': round(1000 * rerun['seconds'], 1),
+            'rows': rerun['rows'],
+            'KB': round(rerun['bytes'] / 1024, 1),
+            'N+1 suspects': len(rerun['n_plus_one']),
+        } for rerun in reruns], use_container_width=True)
+        suspects = [(rerun['page'], shape, count) for rerun in reruns for shape, count in rerun['n_plus_one']]
+        for page, shape, count in suspects[:20]:
+            st.warning(f"Possible N+1 in {page}: {count} × {shape}")
+        with st.expander("Queries in the latest rerun"):
+            st.dataframe([{key: value for key, value in query.items() if key != 'shape'} for query in reruns[0]['detail']],
+                         use_container_width=True)
+    else:
+        st.info("No reruns traced yet.")
+    
+    st.subheader("Slow Rerun Profiles")
+    threshold = slow_threshold()
+    st.caption("Profiling is opt-in: PROFILE_RERUNS=1 for every rerun, or open the app with ?profile=1 to profile your own session. "
+               f"Profiles are written to {PROFILE_DIR}/" + (f"; reruns over {threshold * 1000:.0f} ms are kept as outliers." if threshold else "."))
+    profiles = retained_profiles()
+    if profiles:
+        st.dataframe([{
+            'page': profile['page'],
+            'ms': round(1000 * profile['seconds']),
+            **{category: round(1000 * seconds) for category, seconds in profile['categories'].items()},
+            'slowest flow': next(iter(profile['flows']), ""),
+            'files': profile['path'],
+        } for profile in profiles[:50]], use_container_width=True)
+    else:
+        st.info("No slow reruns profiled yet.")
     
     st.markdown('</div></div>', unsafe_allow_html=True)
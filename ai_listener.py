@@ -1,93 +1,161 @@
-import os
-import openai
 import streamlit as st
-import tempfile
+import queue
 import uuid
-from database import supabase_client
-import numpy as np
-from pydub import AudioSegment
-from streamlit_webrtc import webrtc_streamer, WebRtcMode
+from llm_gateway import get_llm_gateway
+from chat_context import build_context
+from upload_queue import get_upload_queue
 
-OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+LISTENER_SYSTEM_PROMPT = "You are a compassionate AI listener trained to provide support and gather information about mental health concerns. Respond empathetically and ask relevant follow-up questions."
+# Seconds to wait for the next chunk (covers time-to-first-token) and for the whole reply.
+STREAM_READ_TIMEOUT = 15.0
+STREAM_DEADLINE = 60.0
+# Total wait for outstanding segments once recording stops.
+TRANSCRIPTION_TIMEOUT_SECONDS = 30.0
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY must be set in environment variables")
+def listener_context(prompt, history=(), summary="", stats=None):
+    # Earlier turns and the rolling summary, trimmed to the context token budget.
+    return build_context(LISTENER_SYSTEM_PROMPT, [*history, {"role": "user", "content": prompt}], summary, stats=stats)
 
-openai.api_key = OPENAI_API_KEY
+def chat_with_ai(prompt: str, user_id=None, history=(), summary="", context_stats=None) -> str:
+    return get_llm_gateway().chat(
+        "gpt-4o-mini",
+        listener_context(prompt, history, summary, context_stats),
+        user_id=user_id,
+        max_tokens=150
+    )
 
-def chat_with_ai(prompt: str) -> str:
-    response = openai.ChatCompletion.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": "You are a compassionate AI listener trained to provide support and gather information about mental health concerns. Respond empathetically and ask relevant follow-up questions."},
-            {"role": "user", "content": prompt}
-        ],
+def stream_chat_with_ai(prompt: str, cancel_event=None, deadline: float = STREAM_DEADLINE, timings=None, user_id=None,
+                        history=(), summary="", context_stats=None):
+    return get_llm_gateway().stream_chat(
+        "gpt-4o-mini",
+        listener_context(prompt, history, summary, context_stats),
+        user_id=user_id,
+        deadline=deadline,
+        read_timeout=STREAM_READ_TIMEOUT,
+        cancel_event=cancel_event,
+        timings=timings,
         max_tokens=150
     )
-    return response.choices[0].message.content
 
-def generate_summary(messages: list) -> str:
+SUMMARY_SYSTEM_PROMPT = "You are an AI trained to summarize mental health conversations and identify key concerns. Provide a concise summary with potential issues and recommendations."
+
+def generate_summary(messages: list, previous_summary: str = "") -> str:
     conversation = "\n".join([f"{m['role']}: {m['content']}" for m in messages])
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
-        messages=[
-            {"role": "system", "content": "You are an AI trained to summarize mental health conversations and identify key concerns. Provide a concise summary with potential issues and recommendations."},
-            {"role": "user", "content": f"Summarize the following conversation and identify key mental health concerns:\n\n{conversation}"}
+    if previous_summary:
+        request = (f"Here is the summary of the conversation so far:\n\n{previous_summary}\n\n"
+                   f"Update it with the following new turns and identify key mental health concerns:\n\n{conversation}")
+    else:
+        request = f"Summarize the following conversation and identify key mental health concerns:\n\n{conversation}"
+    return get_llm_gateway().chat(
+        "gpt-4",
+        [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": request}
+        ],
+        max_tokens=250
+    )
+
+def merge_summaries(summaries: list) -> str:
+    sections = "\n\n".join(f"Part {i}:\n{summary}" for i, summary in enumerate(summaries, start=1))
+    return get_llm_gateway().chat(
+        "gpt-4",
+        [
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Combine these consecutive summaries of one conversation into a single summary and identify key mental health concerns:\n\n{sections}"}
         ],
         max_tokens=250
     )
-    return response.choices[0].message.content
 
 
 def process_audio_bytes(audio_bytes):
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as temp_audio_file:
-        temp_audio_file.write(audio_bytes)
-        temp_audio_file.flush()
+    from transcription import WhisperTranscriber
 
-        try:
-            with open(temp_audio_file.name, "rb") as audio_file:
-                transcript = openai.Audio.transcribe(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="text"
-                )
-            return transcript
-        except Exception as e:
-            st.write(f"Transcription error: {str(e)}")
-            return None
-        finally:
-            os.unlink(temp_audio_file.name)
-
-def upload_audio_to_supabase(user_id, audio_bytes):
-    file_name = f"{user_id}/{uuid.uuid4()}.wav"
-    response = supabase_client.storage.from_('audio-recordings').upload(file_name, audio_bytes)
-    if response.error:
-        st.write(f"Failed to upload audio: {response.error}")
+    # Sent straight from memory; no temporary file round trip.
+    try:
+        return WhisperTranscriber(get_llm_gateway()).transcribe(audio_bytes)
+    except Exception as e:
+        st.write(f"Transcription error: {str(e)}")
         return None
-    else:
-        st.write("Audio uploaded to Supabase successfully.")
-        return file_name
 
-def audio_input():
+def upload_audio_to_supabase(user_id, audio_bytes, extension="wav", content_type="audio/wav"):
+    # Queued for the background workers; returns immediately with the storage path.
+    file_name = f"{user_id}/{uuid.uuid4()}.{extension}"
+    job = get_upload_queue().enqueue(file_name, audio_bytes, content_type)
+    st.session_state.setdefault('audio_uploads', []).append(job)
+    if job.status == "failed":
+        st.write(f"Failed to upload audio: {job.error}")
+        return None
+    return file_name
+
+def display_upload_status():
+    jobs = st.session_state.get('audio_uploads', [])
+    for job in jobs:
+        if job.status == "done":
+            st.caption(f"Recording saved ({job.size // 1024} KB).")
+        elif job.status == "failed":
+            st.caption(f"Recording upload failed: {job.error}")
+        else:
+            st.caption(f"Uploading recording... {job.bytes_sent * 100 // max(job.size, 1)}%")
+    # Keep only uploads that are still in flight once their final status has been shown.
+    st.session_state['audio_uploads'] = [job for job in jobs if not job.done.is_set()]
+
+def upload_recording(user_id, capture):
+    try:
+        audio_bytes, extension, content_type = capture.encode()
+    except Exception as e:
+        # ffmpeg missing or codec unavailable: fall back to uncompressed audio
+        print(f"Error encoding recording: {str(e)}")
+        audio_bytes, extension, content_type = capture.encode("wav")
+    return upload_audio_to_supabase(user_id, audio_bytes, extension, content_type)
+
+def audio_input(transcriber=None):
+    # numpy and the WebRTC/audio stack load only once a patient opens voice input.
+    from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    from transcription import StreamingTranscription, WhisperTranscriber
+    from audio_capture import AudioCapture, TARGET_SAMPLE_RATE
+
     webrtc_ctx = webrtc_streamer(
         key="speech-to-text",
         mode=WebRtcMode.SENDONLY,
+        audio_receiver_size=1024,
         rtc_configuration={"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]},
         media_stream_constraints={"video": False, "audio": True},
     )
 
-    if webrtc_ctx.state.playing:
-        st.write("Recording... Please speak into the microphone.")
-    else:
+    if not webrtc_ctx.state.playing:
+        # Recording stopped: store the capture and hand back the full transcript.
+        capture = st.session_state.pop('voice_capture', None)
+        transcription = st.session_state.pop('voice_transcription', None)
+        if capture is not None and len(capture.buffer):
+            upload_recording(st.session_state.user['id'], capture)
+        display_upload_status()
+        if transcription is not None:
+            text = transcription.finish(timeout=TRANSCRIPTION_TIMEOUT_SECONDS)
+            if transcription.pending() or transcription.failed():
+                st.warning("Part of your recording could not be transcribed in time; only the transcribed part was sent.")
+            return text or None
         st.write("Not recording yet. Click the button to start recording.")
-    
-    if webrtc_ctx.audio_receiver:
-        audio_frames = webrtc_ctx.audio_receiver.get_frames()
-        if len(audio_frames) > 0:
-            st.write("Audio recorded successfully!")
-            audio_data = np.concatenate([frame.to_ndarray() for frame in audio_frames])
-            return audio_data
-        else:
-            st.write("No audio data captured. Please try recording again.")
-    
+        return None
+
+    st.write("Recording... Please speak into the microphone.")
+    if 'voice_capture' not in st.session_state:
+        st.session_state.voice_capture = AudioCapture()
+        st.session_state.voice_transcription = StreamingTranscription(
+            transcriber or WhisperTranscriber(get_llm_gateway()), sample_rate=TARGET_SAMPLE_RATE
+        )
+    capture = st.session_state.voice_capture
+    transcription = st.session_state.voice_transcription
+
+    transcript_placeholder = st.empty()
+    while webrtc_ctx.audio_receiver:
+        try:
+            audio_frames = webrtc_ctx.audio_receiver.get_frames(timeout=1)
+        except queue.Empty:
+            continue
+        transcription.feed(capture.add_frames(audio_frames))
+        partial_text = transcription.text()
+        if transcription.pending():
+            partial_text += " …"
+        transcript_placeholder.markdown(partial_text)
+
     return None
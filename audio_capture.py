@@ -0,0 +1,118 @@
+import io
+import os
+import numpy as np
+from transcription import frame_to_mono_int16
+
+TARGET_SAMPLE_RATE = 16000
+MAX_RECORDING_SECONDS = int(os.environ.get("MAX_RECORDING_SECONDS", "300"))
+# "opus" (ogg/libopus, ~10x smaller than raw PCM) or "flac" (lossless, ~2x smaller).
+AUDIO_UPLOAD_FORMAT = os.environ.get("AUDIO_UPLOAD_FORMAT", "opus")
+OPUS_BITRATE = "24k"
+
+ENCODINGS = {
+    "opus": {"format": "ogg", "codec": "libopus", "extension": "ogg", "content_type": "audio/ogg"},
+    "flac": {"format": "flac", "codec": None, "extension": "flac", "content_type": "audio/flac"},
+    "wav": {"format": "wav", "codec": None, "extension": "wav", "content_type": "audio/wav"},
+}
+
+class RingBuffer:
+    def __init__(self, capacity):
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._start = 0
+        self._length = 0
+        self.dropped = 0
+
+    @property
+    def capacity(self):
+        return len(self._data)
+
+    def __len__(self):
+        return self._length
+
+    def write(self, samples):
+        # Keeps the most recent `capacity` samples; older ones are overwritten.
+        if len(samples) >= self.capacity:
+            self.dropped += self._length + len(samples) - self.capacity
+            self._data[:] = samples[-self.capacity:]
+            self._start, self._length = 0, self.capacity
+            return
+        end = (self._start + self._length) % self.capacity
+        first = min(len(samples), self.capacity - end)
+        self._data[end:end + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        overflow = max(0, self._length + len(samples) - self.capacity)
+        self.dropped += overflow
+        self._start = (self._start + overflow) % self.capacity
+        self._length = min(self.capacity, self._length + len(samples))
+
+    def read(self):
+        end = self._start + self._length
+        if end <= self.capacity:
+            return self._data[self._start:end].copy()
+        return np.concatenate([self._data[self._start:], self._data[:end - self.capacity]])
+
+    def clear(self):
+        self._start = 0
+        self._length = 0
+        self.dropped = 0
+
+class LinearResampler:
+    # Stateful across frames so there are no discontinuities at frame boundaries.
+    def __init__(self, source_rate, target_rate=TARGET_SAMPLE_RATE):
+        self.source_rate = source_rate
+        self.step = source_rate / target_rate
+        self._position = 0.0
+        self._last = None
+
+    def process(self, samples):
+        if self.step == 1:
+            return samples.astype(np.int16, copy=False)
+        source = samples.astype(np.float32)
+        if self._last is not None:
+            source = np.concatenate([[self._last], source])
+        if len(source) < 2:
+            return np.zeros(0, dtype=np.int16)
+        positions = np.arange(self._position, len(source) - 1, self.step)
+        resampled = np.interp(positions, np.arange(len(source)), source)
+        next_position = positions[-1] + self.step if len(positions) else self._position
+        self._position = next_position - (len(source) - 1)
+        self._last = source[-1]
+        return np.clip(resampled, -32768, 32767).astype(np.int16)
+
+class AudioCapture:
+    def __init__(self, max_seconds=MAX_RECORDING_SECONDS, sample_rate=TARGET_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.buffer = RingBuffer(max_seconds * sample_rate)
+        self._resampler = None
+
+    def add_frames(self, frames):
+        # Returns the newly captured 16 kHz mono samples so they can also feed transcription.
+        captured = []
+        for frame in frames:
+            if self._resampler is None or self._resampler.source_rate != frame.sample_rate:
+                self._resampler = LinearResampler(frame.sample_rate, self.sample_rate)
+            samples = self._resampler.process(frame_to_mono_int16(frame))
+            self.buffer.write(samples)
+            captured.append(samples)
+        return np.concatenate(captured) if captured else np.zeros(0, dtype=np.int16)
+
+    @property
+    def duration(self):
+        return len(self.buffer) / self.sample_rate
+
+    def encode(self, encoding=AUDIO_UPLOAD_FORMAT):
+        from pydub import AudioSegment
+
+        settings = ENCODINGS[encoding]
+        segment = AudioSegment(
+            data=self.buffer.read().tobytes(),
+            sample_width=2,
+            frame_rate=self.sample_rate,
+            channels=1
+        )
+        output = io.BytesIO()
+        export_options = {"format": settings["format"]}
+        if settings["codec"]:
+            export_options.update(codec=settings["codec"], bitrate=OPUS_BITRATE)
+        segment.export(output, **export_options)
+        return output.getvalue(), settings["extension"], settings["content_type"]
@@ -1,5 +1,6 @@
 import streamlit as st
 from database import supabase_client
+from directory import invalidate_directory
 from datetime import datetime
 
 def login():
@@ -55,12 +56,17 @@ def register():
                     'user_type': user_type
                     # 'created_at': datetime.now().isoformat()  # Optional: if you want to track when the user was created
                 }).execute()
+                invalidate_directory(user_id)
 
                 st.success("Registered successfully! Please log in.")
         except Exception as e:
             st.error(f"Registration failed: {str(e)}")
 
 def logout():
+    from summarizer import end_conversation
+
+    # Turns not yet folded into the conversation summary are summarised into the session's report.
+    end_conversation(st.session_state)
     supabase_client.auth.sign_out()
     st.session_state.user = None
     st.rerun()
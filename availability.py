@@ -0,0 +1,157 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from database import supabase_client
+
+SLOT_MINUTES = 60
+WORKING_HOURS = (9, 17)
+WORKING_DAYS = {0, 1, 2, 3, 4}  # Monday-Friday
+# Reload a schedule from the database at most this old, in case another replica booked it.
+SCHEDULE_TTL_SECONDS = 600
+SCHEDULES_MAX_ENTRIES = 5000
+
+SLOT = timedelta(minutes=SLOT_MINUTES)
+
+def appointment_start(appointment):
+    return datetime.fromisoformat(f"{appointment['appointment_date']}T{appointment['appointment_time']}")
+
+class Schedule:
+    # Booked start times for one professional or patient, kept sorted; every booking lasts SLOT.
+    def __init__(self, appointments):
+        self.loaded_at = time.monotonic()
+        bookings = sorted((appointment_start(a), a['id']) for a in appointments)
+        self.starts = [start for start, _ in bookings]
+        self.ids = [appointment_id for _, appointment_id in bookings]
+
+    def conflict(self, start):
+        # Only the neighbours either side of the insertion point can overlap: O(log n).
+        i = bisect.bisect_left(self.starts, start)
+        for j in (i - 1, i):
+            if 0 <= j < len(self.starts) and abs(self.starts[j] - start) < SLOT:
+                return self.ids[j]
+        return None
+
+    def add(self, start, appointment_id):
+        if appointment_id in self.ids:
+            return
+        i = bisect.bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ids.insert(i, appointment_id)
+
+    def remove(self, appointment_id):
+        if appointment_id in self.ids:
+            i = self.ids.index(appointment_id)
+            del self.starts[i]
+            del self.ids[i]
+
+    def next_free(self, start, end, count):
+        slots = []
+        candidate = _align(start)
+        while candidate + SLOT <= end and len(slots) < count:
+            if candidate.weekday() not in WORKING_DAYS or candidate.hour < WORKING_HOURS[0]:
+                candidate = _next_working_start(candidate)
+                continue
+            if candidate + SLOT > candidate.replace(hour=WORKING_HOURS[1], minute=0):
+                candidate = _next_working_start(candidate.replace(hour=0, minute=0) + timedelta(days=1))
+                continue
+            i = bisect.bisect_left(self.starts, candidate)
+            blocking = [self.starts[j] for j in (i - 1, i) if 0 <= j < len(self.starts) and abs(self.starts[j] - candidate) < SLOT]
+            if blocking:
+                # Jump past the booking instead of probing every slot it covers.
+                candidate = _align(max(blocking) + SLOT)
+                continue
+            slots.append(candidate)
+            candidate += SLOT
+        return slots
+
+def _align(moment):
+    moment = moment.replace(second=0, microsecond=0)
+    remainder = (moment.hour * 60 + moment.minute) % SLOT_MINUTES
+    return moment + timedelta(minutes=(SLOT_MINUTES - remainder) % SLOT_MINUTES)
+
+def _next_working_start(moment):
+    day = moment.replace(hour=WORKING_HOURS[0], minute=0, second=0, microsecond=0)
+    if moment > day:
+        day += timedelta(days=1)
+    while day.weekday() not in WORKING_DAYS:
+        day += timedelta(days=1)
+    return day
+
+class AvailabilityIndex:
+    # Per-professional and per-patient schedules, loaded on first use and then kept up to date
+    # incrementally as this process books or cancels appointments.
+    def __init__(self, client):
+        self.client = client
+        self._schedules = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _schedule(self, column, user_id):
+        key = (column, user_id)
+        with self._lock:
+            schedule = self._schedules.get(key)
+            if schedule is not None:
+                self._schedules.move_to_end(key)
+        if schedule is None or time.monotonic() - schedule.loaded_at > SCHEDULE_TTL_SECONDS:
+            appointments = (
+                self.client.table('appointments')
+                .select('id', 'appointment_date', 'appointment_time')
+                .eq(column, user_id)
+                .neq('status', 'cancelled')
+                .gte('appointment_date', datetime.now().date().isoformat())
+                .execute()
+            )
+            schedule = Schedule(appointments.data)
+            with self._lock:
+                self._schedules[key] = schedule
+                self._schedules.move_to_end(key)
+                self._prune()
+        return schedule
+
+    def _prune(self):
+        # Expired schedules would be reloaded on next use anyway; beyond that, least recently used go first.
+        now = time.monotonic()
+        for key in [key for key, schedule in self._schedules.items() if now - schedule.loaded_at > SCHEDULE_TTL_SECONDS]:
+            del self._schedules[key]
+        while len(self._schedules) > SCHEDULES_MAX_ENTRIES:
+            self._schedules.popitem(last=False)
+
+    def find_conflict(self, patient_id, professional_id, start):
+        # Returns which side is double-booked ('professional' or 'patient'), or None.
+        if self._schedule('professional_id', professional_id).conflict(start) is not None:
+            return "professional"
+        if self._schedule('patient_id', patient_id).conflict(start) is not None:
+            return "patient"
+        return None
+
+    def next_free_slots(self, professional_id, start=None, end=None, count=8):
+        start = start or datetime.now()
+        end = end or start + timedelta(days=14)
+        return self._schedule('professional_id', professional_id).next_free(start, end, count)
+
+    def booked(self, appointment):
+        with self._lock:
+            for column in ('professional_id', 'patient_id'):
+                schedule = self._schedules.get((column, appointment[column]))
+                if schedule is not None:
+                    schedule.add(appointment_start(appointment), appointment['id'])
+
+    def released(self, appointment_id):
+        with self._lock:
+            for schedule in self._schedules.values():
+                schedule.remove(appointment_id)
+
+    def invalidate(self, column, user_id):
+        with self._lock:
+            self._schedules.pop((column, user_id), None)
+
+_availability = None
+_availability_lock = threading.Lock()
+
+def get_availability():
+    global _availability
+    with _availability_lock:
+        if _availability is None:
+            _availability = AvailabilityIndex(supabase_client)
+        return _availability
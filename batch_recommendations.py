@@ -0,0 +1,172 @@
+import argparse
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from database import supabase_client
+from activity_recommender import (get_ai_recommendation, get_professional_input, recommendation_input_hash,
+                                  recommendation_request, store_recommendation)
+import metrics
+
+# Nightly job, e.g. from cron:  python batch_recommendations.py --workers 4
+# Regenerates recommendations for patients with moods or professional input newer than their
+# stored recommendation. Progress is checkpointed after every page, so an interrupted run
+# resumes where it stopped when started again.
+CHECKPOINT_PATH = os.environ.get("BATCH_CHECKPOINT_PATH", "batch_recommendations.checkpoint.json")
+PAGE_SIZE = 500
+DEFAULT_WORKERS = 4
+RECENT_MOODS = 5
+
+def patients_due(after_id=None, page_size=PAGE_SIZE):
+    while True:
+        rows = supabase_client.rpc('patients_needing_recommendations', {
+            'after_id': after_id,
+            'page_size': page_size
+        }).execute().data
+        if not rows:
+            return
+        yield [row['id'] for row in rows]
+        if len(rows) < page_size:
+            return
+        after_id = rows[-1]['id']
+
+def load_inputs(user_id):
+    # The same inputs the Activities page hashes, read straight from the database.
+    inputs_as_of = datetime.now(timezone.utc).isoformat()
+    user = supabase_client.table('users').select('*').eq('id', user_id).execute().data
+    moods = supabase_client.table('mood_journal').select('mood').eq('user_id', user_id).order('created_at', desc=True).limit(RECENT_MOODS).execute().data
+    if len(user) != 1 or not moods:
+        return None
+    return user[0], [{'mood': mood['mood']} for mood in moods], get_professional_input(user_id), inputs_as_of
+
+def generate(user_id):
+    inputs = load_inputs(user_id)
+    if inputs is None:
+        return "skipped"
+    user_data, recent_moods, professional_input, inputs_as_of = inputs
+    # Retries with backoff happen in llm_gateway; the pool size bounds concurrency from this side.
+    recommendation = get_ai_recommendation(user_data, recent_moods, professional_input)
+    input_hash = recommendation_input_hash(user_data, recent_moods, professional_input)
+    if not store_recommendation(user_id, input_hash, recommendation, inputs_as_of):
+        raise RuntimeError("could not store recommendation")
+    return "generated"
+
+def batch_request(user_id):
+    # One line of an OpenAI Batch API input file; custom_id carries what is needed to store the result.
+    inputs = load_inputs(user_id)
+    if inputs is None:
+        return None
+    user_data, recent_moods, professional_input, inputs_as_of = inputs
+    input_hash = recommendation_input_hash(user_data, recent_moods, professional_input)
+    return {
+        'custom_id': f"{user_id}|{input_hash}|{inputs_as_of}",
+        'method': 'POST',
+        'url': '/v1/chat/completions',
+        'body': recommendation_request(user_data, recent_moods, professional_input)
+    }
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as checkpoint_file:
+        return json.load(checkpoint_file)
+
+def save_checkpoint(path, checkpoint):
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w", encoding="utf-8") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, path)
+
+def run(workers=DEFAULT_WORKERS, checkpoint_path=CHECKPOINT_PATH, batch_file=None, fresh=False, limit=None):
+    checkpoint = None if fresh else load_checkpoint(checkpoint_path)
+    if checkpoint is not None and checkpoint.get('batch_file') != batch_file:
+        raise SystemExit(f"{checkpoint_path} belongs to a different kind of run; pass --fresh to discard it")
+    if checkpoint is None:
+        checkpoint = {'run_id': str(uuid.uuid4()), 'started_at': datetime.now(timezone.utc).isoformat(),
+                      'batch_file': batch_file, 'after_id': None, 'generated': 0, 'skipped': 0, 'failed': []}
+        if batch_file and os.path.exists(batch_file):
+            os.remove(batch_file)
+    else:
+        print(f"Resuming run {checkpoint['run_id']} after patient {checkpoint['after_id']}")
+
+    task = batch_request if batch_file else generate
+    processed = 0
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recommendations") as pool:
+        for page in patients_due(checkpoint['after_id']):
+            if limit is not None:
+                page = page[:max(limit - processed, 0)]
+                if not page:
+                    break
+            futures = {user_id: pool.submit(task, user_id) for user_id in page}
+            lines = []
+            for user_id, future in futures.items():
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error generating recommendation for {user_id}: {str(e)}")
+                    checkpoint['failed'].append(user_id)
+                    metrics.increment('batch_recommendations_total', outcome="failed")
+                    continue
+                if result is None or result == "skipped":
+                    checkpoint['skipped'] += 1
+                    outcome = "skipped"
+                else:
+                    checkpoint['generated'] += 1
+                    outcome = "generated"
+                    if batch_file:
+                        lines.append(json.dumps(result))
+                metrics.increment('batch_recommendations_total', outcome=outcome)
+            if lines:
+                with open(batch_file, "a", encoding="utf-8") as output:
+                    output.write("\n".join(lines) + "\n")
+            # Everything up to the last patient of this page is done (or recorded as failed).
+            checkpoint['after_id'] = page[-1]
+            save_checkpoint(checkpoint_path, checkpoint)
+            processed += len(page)
+            print(f"{checkpoint['generated']} {'requests written' if batch_file else 'generated'}, "
+                  f"{checkpoint['skipped']} skipped, {len(checkpoint['failed'])} failed")
+
+    if limit is None or processed < limit:
+        # Finished: failed patients are still due, so the next run picks them up again.
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+    return checkpoint
+
+def import_batch_results(path):
+    # Stores the output file of a completed OpenAI batch created from --batch-file.
+    stored, failed = 0, 0
+    with open(path, encoding="utf-8") as results:
+        for line in results:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            user_id, input_hash, inputs_as_of = result['custom_id'].split("|", 2)
+            response = result.get('response') or {}
+            if result.get('error') or response.get('status_code') != 200:
+                print(f"Batch request for {user_id} failed: {result.get('error') or response.get('status_code')}")
+                failed += 1
+                continue
+            recommendation = response['body']['choices'][0]['message']['content']
+            if store_recommendation(user_id, input_hash, recommendation, inputs_as_of):
+                stored += 1
+            else:
+                failed += 1
+    print(f"Stored {stored} recommendations, {failed} failed")
+    return stored, failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute activity recommendations for patients with new input.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="concurrent patients (bounds LLM concurrency)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint and start over")
+    parser.add_argument("--limit", type=int, help="stop after this many patients (the checkpoint is kept)")
+    parser.add_argument("--batch-file", help="write OpenAI Batch API requests to this JSONL file instead of calling the API")
+    parser.add_argument("--import-batch", metavar="RESULTS", help="store the results file of a completed batch")
+    args = parser.parse_args()
+    if args.import_batch:
+        import_batch_results(args.import_batch)
+    else:
+        run(args.workers, args.checkpoint, args.batch_file, args.fresh, args.limit)
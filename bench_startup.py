@@ -0,0 +1,83 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+# What a fresh worker imports before it can render each kind of session.
+SCENARIOS = {
+    "login": ["main"],
+    "patient": ["main", "patient"],
+    "professional": ["main", "professional"],
+    "admin": ["main", "admin"],
+    "patient+voice": ["main", "patient", "streamlit_webrtc", "transcription", "audio_capture"],
+}
+
+PROBE = """
+import resource, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(f"BENCH {{elapsed}} {{rss}} {{len(sys.modules)}}")
+"""
+
+def run_scenario(modules):
+    env = {
+        "SUPABASE_URL": "https://bench.supabase.co",
+        "SUPABASE_KEY": "bench-key",
+        **os.environ,
+        # No background realtime connection or migrations while measuring imports.
+        "SUPABASE_REALTIME": "0",
+        "DATABASE_URL": "",
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(modules=modules)],
+        cwd=Path(__file__).parent, env=env, capture_output=True, text=True,
+    )
+    marker = [line for line in result.stdout.splitlines() if line.startswith("BENCH ")]
+    if result.returncode != 0 or not marker:
+        raise RuntimeError(f"Importing {', '.join(modules)} failed:\n{result.stderr[-2000:]}")
+    _, elapsed, rss, module_count = marker[-1].split()
+    return float(elapsed), int(rss), int(module_count), parse_importtime(result.stderr)
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package", summed per top-level package.
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|", 2)
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+    return packages
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time and memory per session type.")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="packages to list per scenario, by import time")
+    parser.add_argument("--output", help="also write the report to this file (e.g. bench_output.txt)")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    lines = []
+    for scenario in args.scenarios:
+        runs = [run_scenario(SCENARIOS[scenario]) for _ in range(args.repeat)]
+        elapsed = statistics.median(run[0] for run in runs)
+        rss = statistics.median(run[1] for run in runs)
+        # ru_maxrss is in KiB on Linux and bytes on macOS.
+        rss_mb = rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+        lines.append(f"{scenario}: {elapsed * 1000:.0f} ms import, {rss_mb:.1f} MB max RSS, {runs[-1][2]} modules")
+        slowest = sorted(runs[-1][3].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        for name, cumulative in slowest:
+            lines.append(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        Path(args.output).write_text(report + "\n")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+import streamlit as st
+
+# Tables whose changes the dashboards follow.
+FEED_TABLES = ('reports', 'appointments', 'activities')
+FEED_RECONNECT_SECONDS = 5
+LIVE_REFRESH_SECONDS = 3
+LIVE_QUERY_MAX_ENTRIES = 256
+
+class EventBus:
+    # In-process pub/sub for row changes: {'table', 'type', 'record', 'old_record'}.
+    # The Supabase feed publishes into it; tests can publish directly.
+    def __init__(self):
+        self._subscribers = defaultdict(list)
+        self._lock = threading.Lock()
+        self.connected = False
+        # Bumped on every (re)connect: changes made while disconnected were never delivered, so
+        # anything loaded in an earlier epoch has to be reloaded.
+        self.epoch = 0
+
+    def set_connected(self, connected):
+        with self._lock:
+            if connected and not self.connected:
+                self.epoch += 1
+            self.connected = connected
+
+    def subscribe(self, table, callback):
+        with self._lock:
+            self._subscribers[table].append(callback)
+        return callback
+
+    def unsubscribe(self, table, callback):
+        with self._lock:
+            if callback in self._subscribers[table]:
+                self._subscribers[table].remove(callback)
+
+    def publish(self, change):
+        with self._lock:
+            callbacks = list(self._subscribers[change['table']])
+        for callback in callbacks:
+            try:
+                callback(change)
+            except Exception as e:
+                print(f"Error applying {change['type']} on {change['table']}: {str(e)}")
+
+class SupabaseChangeFeed:
+    # Listens to Supabase Realtime postgres_changes on a background event loop.
+    def __init__(self, url, key, bus, tables=FEED_TABLES):
+        self.url = url
+        self.key = key
+        self.bus = bus
+        self.tables = tables
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                asyncio.run(self._listen())
+            except Exception as e:
+                print(f"Realtime change feed disconnected: {str(e)}")
+            self.bus.set_connected(False)
+            time.sleep(FEED_RECONNECT_SECONDS)
+
+    async def _listen(self):
+        from supabase import acreate_client
+        from realtime import RealtimePostgresChangesListenEvent, RealtimeSubscribeStates
+
+        client = await acreate_client(self.url, self.key)
+        channel = client.channel("dashboard-changes")
+        for table in self.tables:
+            channel.on_postgres_changes(RealtimePostgresChangesListenEvent.All, schema="public", table=table,
+                                        callback=self._on_change)
+        closed = asyncio.Event()
+
+        def on_status(status, error):
+            if status == RealtimeSubscribeStates.SUBSCRIBED:
+                self.bus.set_connected(True)
+            elif status in (RealtimeSubscribeStates.CLOSED, RealtimeSubscribeStates.CHANNEL_ERROR,
+                            RealtimeSubscribeStates.TIMED_OUT):
+                self.bus.set_connected(False)
+                closed.set()
+
+        await channel.subscribe(on_status)
+        await closed.wait()
+
+    def _on_change(self, payload):
+        data = payload['data']
+        self.bus.publish({
+            'table': data['table'],
+            'type': data['type'],
+            'record': data.get('record') or {},
+            'old_record': data.get('old_record') or {},
+        })
+
+class LiveQuery:
+    # Rows of one query, loaded once and then patched from change events while the feed is
+    # connected. Without a feed it falls back to re-running the loader every time.
+    def __init__(self, bus, table, loader, predicate):
+        self.bus = bus
+        self.table = table
+        self.loader = loader
+        self.predicate = predicate
+        self._rows = None
+        self._epoch = None
+        # Goes up only when a row this query holds is added, changed or removed.
+        self.version = 0
+        # Changes that arrive while the loader runs, applied on top of what it returns.
+        self._pending = None
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        bus.subscribe(table, self._apply)
+
+    def rows(self):
+        with self._lock:
+            if self._fresh():
+                return list(self._rows.values())
+        with self._load_lock:
+            with self._lock:
+                if self._fresh():
+                    return list(self._rows.values())
+                epoch = self.bus.epoch
+                self._pending = []
+            try:
+                loaded = {row['id']: row for row in self.loader()}
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for change in self._pending:
+                    self._patch(loaded, change)
+                self._pending = None
+                if self._rows is not None and loaded != self._rows:
+                    self.version += 1
+                self._rows, self._epoch = loaded, epoch
+                return list(loaded.values())
+
+    def _fresh(self):
+        return self._rows is not None and self.bus.connected and self._epoch == self.bus.epoch
+
+    def _apply(self, change):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(change)
+            elif self._rows is not None and self._patch(self._rows, change):
+                self.version += 1
+
+    def _patch(self, rows, change):
+        # Returns whether the rows changed.
+        record, old_record = change['record'], change['old_record']
+        if change['type'] == 'DELETE':
+            return rows.pop(old_record.get('id'), None) is not None
+        if self.predicate(record):
+            current = rows.get(record['id'])
+            updated = {**(current or {}), **record}
+            rows[record['id']] = updated
+            return updated != current
+        return rows.pop(record.get('id'), None) is not None
+
+_bus = None
+_live_queries = OrderedDict()
+_bus_lock = threading.Lock()
+
+def get_change_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = EventBus()
+            _register_cache_updates(_bus)
+            if os.environ.get("SUPABASE_REALTIME", "1") == "1":
+                SupabaseChangeFeed(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"], _bus).start()
+        return _bus
+
+def live_query(name, table, loader, predicate=lambda record: True):
+    bus = get_change_bus()
+    with _bus_lock:
+        if name not in _live_queries:
+            _live_queries[name] = LiveQuery(bus, table, loader, predicate)
+        _live_queries.move_to_end(name)
+        while len(_live_queries) > LIVE_QUERY_MAX_ENTRIES:
+            _, evicted = _live_queries.popitem(last=False)
+            bus.unsubscribe(evicted.table, evicted._apply)
+        return _live_queries[name]
+
+def query_versions(*names):
+    # The feed epoch and each named query's version; None for queries no longer held.
+    bus = get_change_bus()
+    with _bus_lock:
+        return (bus.epoch,) + tuple(_live_queries[name].version if name in _live_queries else None for name in names)
+
+@st.fragment(run_every=LIVE_REFRESH_SECONDS)
+def _watch(key, names):
+    # Ticks compare in-memory counters only. A nested fragment can only rerun itself, so a change
+    # to rows this tab shows reruns the page, which renders just the selected tab.
+    if query_versions(*names) != st.session_state.get(f"seen_changes_{key}"):
+        st.rerun()
+
+def watch_queries(key, *names):
+    # Called by a tab after it has read the named live queries: the tab is refreshed when one
+    # of them changes, and never for changes to rows it does not show.
+    st.session_state[f"seen_changes_{key}"] = query_versions(*names)
+    if get_change_bus().connected:
+        _watch(key, names)
+
+def _register_cache_updates(bus):
+    from availability import get_availability
+
+    def update_availability(change):
+        record = change['record']
+        appointment_id = record.get('id') or change['old_record'].get('id')
+        if change['type'] != 'INSERT':
+            get_availability().released(appointment_id)
+        if change['type'] != 'DELETE' and record.get('status') != 'cancelled':
+            get_availability().booked(record)
+
+    bus.subscribe('appointments', update_availability)
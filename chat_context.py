@@ -0,0 +1,83 @@
+import functools
+import hashlib
+import os
+import metrics
+
+# Prompt tokens allowed per request: system prompt, rolling summary and as many recent turns
+# as fit. The reply's max_tokens comes on top of this.
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKENS", "3000"))
+# Per-message framing the chat format adds around each message's content.
+MESSAGE_OVERHEAD_TOKENS = 4
+TOKENIZER_ENCODING = "o200k_base"
+TOKENIZER_URL = "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken"
+# Fetched at deploy time (python chat_context.py --prefetch); the app itself never downloads it.
+TOKENIZER_CACHE_DIR = os.environ.get("TIKTOKEN_CACHE_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "tokenizer_cache")
+CONTEXT_TOKEN_BUCKETS = (250, 500, 1000, 2000, 3000, 4000, 6000, 8000)
+
+def _tokenizer_file():
+    # Where tiktoken caches TOKENIZER_URL inside TIKTOKEN_CACHE_DIR.
+    return os.path.join(TOKENIZER_CACHE_DIR, hashlib.sha1(TOKENIZER_URL.encode()).hexdigest())
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    # tiktoken downloads a missing encoding with no timeout, so it is only used when the file is
+    # already cached; otherwise counts fall back to a character estimate.
+    if not os.path.exists(_tokenizer_file()):
+        print(f"Tokenizer file not found in {TOKENIZER_CACHE_DIR}, estimating token counts")
+        return None
+    os.environ["TIKTOKEN_CACHE_DIR"] = TOKENIZER_CACHE_DIR
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(TOKENIZER_ENCODING)
+    except Exception as e:
+        print(f"Tokenizer unavailable, estimating token counts: {str(e)}")
+        return None
+
+def prefetch_tokenizer():
+    import tiktoken
+
+    os.environ["TIKTOKEN_CACHE_DIR"] = TOKENIZER_CACHE_DIR
+    tiktoken.get_encoding(TOKENIZER_ENCODING)
+    print(f"Cached {TOKENIZER_ENCODING} in {TOKENIZER_CACHE_DIR}")
+
+@functools.lru_cache(maxsize=8192)
+def count_tokens(text):
+    # Cached by content, so each message is tokenized once however many requests include it.
+    encoding = _encoding()
+    if encoding is None:
+        # Roughly four characters per token for English text.
+        return len(text) // 4 + 1
+    return len(encoding.encode(text))
+
+def message_tokens(message):
+    return count_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS
+
+def build_context(system_prompt, turns, summary="", budget=CONTEXT_TOKEN_BUDGET, stats=None):
+    # turns: the conversation oldest first, ending with the new user message, which is always sent.
+    # Older turns are added newest first until the budget is spent; the summary covers the rest.
+    # stats, if given, receives how many earlier turns were sent and how many were left out.
+    header = [{"role": "system", "content": system_prompt}]
+    if summary:
+        header.append({"role": "system", "content": f"Summary of the conversation so far:\n{summary}"})
+    latest = {"role": turns[-1]['role'], "content": turns[-1]['content']}
+    used = sum(message_tokens(message) for message in header) + message_tokens(latest)
+    recent = []
+    for turn in reversed(turns[:-1]):
+        cost = message_tokens(turn)
+        if used + cost > budget:
+            break
+        recent.append({"role": turn['role'], "content": turn['content']})
+        used += cost
+    metrics.observe('chat_context_tokens', used, buckets=CONTEXT_TOKEN_BUCKETS)
+    metrics.observe('chat_context_turns', len(recent) + 1, buckets=(1, 2, 4, 8, 16, 32, 64))
+    if stats is not None:
+        stats['included_turns'] = len(recent)
+        stats['evicted_turns'] = len(turns) - 1 - len(recent)
+    return header + recent[::-1] + [latest]
+
+if __name__ == "__main__":
+    import sys
+
+    if "--prefetch" in sys.argv:
+        prefetch_tokenizer()
@@ -0,0 +1,66 @@
+from datetime import datetime, timezone
+from database import supabase_client
+from write_buffer import get_write_buffer
+
+# Messages held in the session and rendered by default; older ones load a page at a time,
+# up to CHAT_MAX_LOADED in memory.
+CHAT_WINDOW = 20
+CHAT_PAGE_SIZE = 20
+CHAT_MAX_LOADED = 200
+
+class ChatHistory:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.messages = []
+        self.has_older = False
+
+def get_chat_history(session_state, user_id):
+    history = session_state.get('chat_history')
+    if history is None or history.user_id != user_id:
+        history = session_state['chat_history'] = ChatHistory(user_id)
+        try:
+            history.messages, history.has_older = load_messages(user_id, CHAT_WINDOW)
+        except Exception as e:
+            print(f"Error loading chat history: {str(e)}")
+    return history
+
+def load_messages(user_id, limit, before=None):
+    # Newest `limit` messages (older than `before`, if given), returned oldest first.
+    query = supabase_client.table('chat_messages').select('role', 'content', 'created_at', 'client_ref').eq('user_id', user_id)
+    if before:
+        query = query.lt('created_at', before)
+    rows = query.order('created_at', desc=True).limit(limit + 1).execute().data
+    has_older = len(rows) > limit
+    if before is None:
+        # Turns still waiting in the write buffer are the newest messages.
+        rows = get_write_buffer().merge_pending('chat_messages', rows, user_id=user_id)
+        has_older = has_older or len(rows) > limit
+    return [_message(row) for row in reversed(rows[:limit])], has_older
+
+def load_older(history):
+    if not history.messages:
+        return
+    try:
+        older, history.has_older = load_messages(history.user_id, CHAT_PAGE_SIZE, before=history.messages[0]['created_at'])
+        history.messages[:0] = older
+    except Exception as e:
+        print(f"Error loading older chat messages: {str(e)}")
+
+def append_message(history, role, content):
+    # Append-only: the row is batched into chat_messages by the write-behind buffer.
+    row = get_write_buffer().insert('chat_messages', {
+        'user_id': history.user_id,
+        'role': role,
+        'content': content,
+        'created_at': datetime.now(timezone.utc).isoformat()
+    })
+    message = _message(row)
+    history.messages.append(message)
+    # Each new turn collapses the view back to the recent window; older turns stay in the table.
+    if len(history.messages) > CHAT_WINDOW:
+        del history.messages[:-CHAT_WINDOW]
+        history.has_older = True
+    return message
+
+def _message(row):
+    return {'role': row['role'], 'content': row['content'], 'created_at': row['created_at']}
@@ -0,0 +1,34 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# One keep-alive connection pool shared by every thread; retries are left to llm_gateway.
+OPENAI_MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "64"))
+
+_openai_client = None
+_clients_lock = threading.Lock()
+
+def get_openai_client():
+    # Built on first use, so sessions that never call the API skip importing openai and
+    # a missing key only fails the features that need it.
+    global _openai_client
+    with _clients_lock:
+        if _openai_client is None:
+            import httpx
+            import openai
+
+            api_key = os.environ.get("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("OPENAI_API_KEY must be set in environment variables")
+            # OPENAI_BASE_URL (read by the client) can point at fake_openai.py for local runs.
+            _openai_client = openai.OpenAI(
+                api_key=api_key,
+                max_retries=0,
+                http_client=openai.DefaultHttpxClient(limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONNECTIONS,
+                    max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+                ))
+            )
+        return _openai_client
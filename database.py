@@ -1,6 +1,7 @@
 import os
 from supabase import create_client, Client
 from dotenv import load_dotenv  # Import this
+from query_trace import TracedClient
 
 load_dotenv()  # Add this line to load variables from .env
 
@@ -10,25 +11,5 @@ SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 if not SUPABASE_URL or not SUPABASE_KEY:
     raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set in environment variables")
 
-supabase_client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-def initialize_database():
-    try:
-        # Check if tables exist
-        table_exists('users')
-        table_exists('reports')
-        table_exists('appointments')
-        print("Database initialization successful")
-    except Exception as e:
-        print(f"Error initializing database: {str(e)}")
-        raise
-
-def table_exists(table_name):
-    try:
-        # Try to fetch a single row from the table
-        supabase_client.table(table_name).select('*').limit(1).execute()
-        print(f"{table_name} table exists")
-        return True
-    except Exception as e:
-        print(f"{table_name} table does not exist: {str(e)}")
-        return False
+# Every table/rpc query is timed and attributed to the current rerun (see query_trace)
+supabase_client: Client = TracedClient(create_client(SUPABASE_URL, SUPABASE_KEY))
@@ -0,0 +1,54 @@
+import streamlit as st
+from database import supabase_client
+import identity
+
+DIRECTORY_TTL_SECONDS = 300
+DIRECTORY_MAX_ENTRIES = 8
+USER_PAGE_SIZE = 25
+
+class UserDirectory:
+    def __init__(self, users):
+        self.users = users
+        self.by_id = {user['id']: user for user in users}
+        self.by_email = {user['email']: user['id'] for user in users}
+        self.emails = [user['email'] for user in users]
+
+    def id_for_email(self, email):
+        return self.by_email.get(email)
+
+# cache_resource rather than cache_data: every rerun shares one object instead of unpickling a copy.
+@st.cache_resource(ttl=DIRECTORY_TTL_SECONDS, max_entries=DIRECTORY_MAX_ENTRIES, show_spinner=False)
+def get_directory(user_type=None):
+    query = supabase_client.table('users').select('id', 'email', 'user_type', 'status', 'created_at')
+    if user_type:
+        query = query.eq('user_type', user_type)
+    users = query.execute().data
+    identity.remember(users)
+    return UserDirectory(users)
+
+def invalidate_directory(user_id=None):
+    get_directory.clear()
+    identity.invalidate(user_id)
+
+def page_users(after=None, user_type=None, status=None, email_prefix=None, limit=USER_PAGE_SIZE):
+    # Keyset page, newest first: `after` is the (created_at, id) of the last row already shown.
+    query = (
+        supabase_client.table('users')
+        .select('id', 'email', 'user_type', 'status', 'created_at')
+        .order('created_at', desc=True)
+        .order('id', desc=True)
+        .limit(limit + 1)
+    )
+    if after:
+        created_at, user_id = after
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{user_id})')
+    if user_type:
+        query = query.eq('user_type', user_type)
+    if status:
+        query = query.eq('status', status)
+    if email_prefix:
+        escaped = email_prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.ilike('email', f'{escaped}%')
+    rows = query.execute().data
+    next_cursor = (rows[limit - 1]['created_at'], rows[limit - 1]['id']) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -0,0 +1,125 @@
+import argparse
+import json
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the OpenAI API (chat completions, streaming, transcriptions), with
+# configurable latency and injected failures. Point the app at it with
+#   OPENAI_BASE_URL=http://127.0.0.1:8787/v1 OPENAI_API_KEY=fake streamlit run main.py
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients that give up (deadlines, cancelled streams) just close the socket.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class FakeOpenAI:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, fail_first=0, fail_status=429,
+                 retry_after=None, reply="I hear you. Tell me more about how that felt."):
+        self.latency = latency
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.reply = reply
+        self.requests = []
+        self.lock = threading.Lock()
+        self.server = _Server((host, port), _handler(self))
+        self._thread = threading.Thread(target=self.server.serve_forever, name="fake-openai", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _should_fail(self, path):
+        with self.lock:
+            self.requests.append(path)
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                return True
+        return False
+
+def _handler(fake):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            if fake._should_fail(self.path):
+                headers = {"retry-after": str(fake.retry_after)} if fake.retry_after is not None else {}
+                return self._json(fake.fail_status, {"error": {"message": "Injected failure", "type": "fake_error"}}, headers)
+            time.sleep(fake.latency)
+            if self.path.endswith("/chat/completions"):
+                return self._chat(json.loads(body))
+            if self.path.endswith("/audio/transcriptions"):
+                return self._text(200, "This is a fake transcript.")
+            self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        def _chat(self, request):
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            usage = {"prompt_tokens": sum(len(m.get("content", "").split()) for m in request.get("messages", [])),
+                     "completion_tokens": len(fake.reply.split())}
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            base = {"id": completion_id, "created": int(time.time()), "model": request.get("model", "fake")}
+            if not request.get("stream"):
+                return self._json(200, {**base, "object": "chat.completion", "usage": usage, "choices": [
+                    {"index": 0, "message": {"role": "assistant", "content": fake.reply}, "finish_reason": "stop"}]})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            chunk = {**base, "object": "chat.completion.chunk"}
+            words = fake.reply.split(" ")
+            for i, word in enumerate(words):
+                delta = {"role": "assistant", "content": word} if i == 0 else {"content": " " + word}
+                self._event({**chunk, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            self._event({**chunk, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._event({**chunk, "choices": [], "usage": usage})
+            self.wfile.write(b"data: [DONE]\n\n")
+
+        def _event(self, payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode())
+            self.wfile.flush()
+
+        def _json(self, status, payload, headers=None):
+            self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+        def _text(self, status, text):
+            self._send(status, text.encode(), "text/plain")
+
+        def _send(self, status, data, content_type, headers=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI API server for local development.")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response")
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N requests with --fail-status")
+    parser.add_argument("--fail-status", type=int, default=429)
+    args = parser.parse_args()
+    fake = FakeOpenAI(port=args.port, latency=args.latency, fail_first=args.fail_first, fail_status=args.fail_status)
+    print(f"Fake OpenAI API listening on {fake.base_url}")
+    fake.server.serve_forever()
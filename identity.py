@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+from database import supabase_client
+from parallel import submit
+import metrics
+
+CACHE_TTL_SECONDS = 300
+CACHE_MAX_ENTRIES = 5000
+# ids per `in_()` query: 100 uuids keep the request URL near 4 KB, well under proxy and
+# PostgREST URL limits.
+RESOLVE_CHUNK_SIZE = 100
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def _cached(user_id, now):
+    entry = _cache.get(user_id)
+    if entry is None:
+        return None
+    expires_at, identity = entry
+    if expires_at < now:
+        del _cache[user_id]
+        return None
+    _cache.move_to_end(user_id)
+    return identity
+
+def _store(identity, now):
+    _cache[identity['id']] = (now + CACHE_TTL_SECONDS, identity)
+    _cache.move_to_end(identity['id'])
+    while len(_cache) > CACHE_MAX_ENTRIES:
+        _cache.popitem(last=False)
+
+def remember(users):
+    now = time.monotonic()
+    with _lock:
+        for user in users:
+            _store({'id': user['id'], 'email': user['email'], 'user_type': user['user_type']}, now)
+
+def resolve_users(user_ids):
+    # Resolve every id a page needs with `in_()` queries of RESOLVE_CHUNK_SIZE ids, run in
+    # parallel; hits come from the TTL cache.
+    ids = {user_id for user_id in user_ids if user_id}
+    now = time.monotonic()
+    resolved = {}
+    with _lock:
+        for user_id in ids:
+            identity = _cached(user_id, now)
+            if identity is not None:
+                resolved[user_id] = identity
+
+    missing = list(ids - resolved.keys())
+    chunks = [missing[start:start + RESOLVE_CHUNK_SIZE] for start in range(0, len(missing), RESOLVE_CHUNK_SIZE)]
+    futures = [submit(_fetch_users, chunk) for chunk in chunks]
+    for chunk, future in zip(chunks, futures):
+        try:
+            users = future.result()
+        except Exception as e:
+            # The other chunks still resolve; only these ids fall back to "unknown".
+            metrics.increment('identity_resolve_failures_total')
+            print(f"Error resolving {len(chunk)} users: {str(e)}")
+            continue
+        with _lock:
+            for user in users:
+                identity = {'id': user['id'], 'email': user['email'], 'user_type': user['user_type']}
+                _store(identity, now)
+                resolved[user['id']] = identity
+    return resolved
+
+def _fetch_users(user_ids):
+    return supabase_client.table('users').select('id', 'email', 'user_type').in_('id', user_ids).execute().data
+
+def resolve_emails(user_ids):
+    return {user_id: identity['email'] for user_id, identity in resolve_users(user_ids).items()}
+
+def invalidate(user_id=None):
+    with _lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
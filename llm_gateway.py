@@ -0,0 +1,244 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+import metrics
+from clients import get_openai_client
+
+# Every OpenAI call goes through the gateway, so a slow or rate-limited upstream queues here
+# (bounded by the caller's deadline) instead of tying up every Streamlit worker thread.
+MODEL_CONCURRENCY = {"gpt-4": 4, "gpt-4o-mini": 16, "whisper-1": 4}
+DEFAULT_CONCURRENCY = 8
+# Per-user token bucket: sustained requests per second and burst size.
+USER_RATE_PER_SECOND = 0.5
+USER_BURST = 6
+USER_BUCKETS_MAX_ENTRIES = 10000
+DEFAULT_DEADLINE = 60.0
+REQUEST_TIMEOUT = 30.0
+MAX_ATTEMPTS = 4
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 8.0
+
+class LLMError(Exception):
+    pass
+
+class LLMTimeout(LLMError):
+    pass
+
+class LLMRateLimited(LLMError):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many requests, please try again in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, cost=1):
+        # Takes the tokens now (possibly into debt) and returns how long to wait before using them.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= cost
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, cost=1):
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + cost)
+
+class LLMGateway:
+    def __init__(self, client_factory=get_openai_client, model_concurrency=MODEL_CONCURRENCY,
+                 user_rate=USER_RATE_PER_SECOND, user_burst=USER_BURST):
+        self.client_factory = client_factory
+        self.model_concurrency = model_concurrency
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._semaphores = {}
+        self._buckets = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def chat(self, model, messages, user_id=None, deadline=DEFAULT_DEADLINE, **params):
+        # Identical requests already in flight share one upstream call.
+        key = hashlib.sha256(json.dumps([model, messages, params], sort_keys=True, default=str).encode()).hexdigest()
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            metrics.increment('llm_coalesced_total', model=model)
+            try:
+                return future.result(timeout=deadline)
+            except FutureTimeout:
+                raise LLMTimeout(f"{model} request exceeded its {deadline:.0f}s deadline")
+        try:
+            response = self._call("chat", model, user_id, deadline, lambda client, timeout: client.chat.completions.create(
+                model=model, messages=messages, timeout=timeout, **params))
+            content = response.choices[0].message.content
+            future.set_result(content)
+            return content
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def transcribe(self, file, model="whisper-1", user_id=None, deadline=DEFAULT_DEADLINE, **params):
+        return self._call("transcribe", model, user_id, deadline, lambda client, timeout: client.audio.transcriptions.create(
+            model=model, file=file, timeout=timeout, **params))
+
+    def stream_chat(self, model, messages, user_id=None, deadline=DEFAULT_DEADLINE, read_timeout=REQUEST_TIMEOUT,
+                    cancel_event=None, timings=None, **params):
+        # Yields content deltas. Opening the stream is retried like any other call; once tokens
+        # have been yielded a failure is raised to the caller.
+        started = time.monotonic()
+        deadline_at = started + deadline
+        self._throttle(user_id, deadline_at)
+        semaphore = self._semaphore(model)
+        stream = self._open_stream(model, messages, semaphore, deadline_at, read_timeout, params)
+        outcome = "completed"
+        first_token_seconds = None
+        try:
+            for chunk in stream:
+                if chunk.usage is not None:
+                    self._record_usage(model, chunk.usage)
+                if cancel_event is not None and cancel_event.is_set():
+                    outcome = "cancelled"
+                    break
+                if time.monotonic() > deadline_at:
+                    outcome = "timeout"
+                    break
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                if first_token_seconds is None:
+                    first_token_seconds = time.monotonic() - started
+                    metrics.observe('llm_time_to_first_token_seconds', first_token_seconds, model=model)
+                    if timings is not None:
+                        timings['time_to_first_token'] = first_token_seconds
+                yield chunk.choices[0].delta.content
+        except GeneratorExit:
+            # Streamlit closes the generator when a new interaction interrupts the rerun.
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            stream.close()
+            semaphore.release()
+            metrics.observe('llm_request_seconds', time.monotonic() - started, model=model, operation="stream")
+            metrics.increment('llm_requests_total', model=model, operation="stream", outcome=outcome)
+
+    def _open_stream(self, model, messages, semaphore, deadline_at, read_timeout, params):
+        # Returns the open stream with the model's slot still held; stream_chat releases it.
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self._acquire(semaphore, model, deadline_at)
+            try:
+                return self.client_factory().chat.completions.create(
+                    model=model, messages=messages, stream=True, stream_options={"include_usage": True},
+                    timeout=min(read_timeout, max(deadline_at - time.monotonic(), 0.1)), **params)
+            except Exception as e:
+                semaphore.release()
+                self._backoff(e, attempt, model, "stream", deadline_at)
+
+    def _call(self, operation, model, user_id, deadline, request):
+        started = time.monotonic()
+        deadline_at = started + deadline
+        self._throttle(user_id, deadline_at)
+        semaphore = self._semaphore(model)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self._acquire(semaphore, model, deadline_at)
+            try:
+                response = request(self.client_factory(), min(REQUEST_TIMEOUT, max(deadline_at - time.monotonic(), 0.1)))
+            except Exception as e:
+                semaphore.release()
+                self._backoff(e, attempt, model, operation, deadline_at)
+                continue
+            semaphore.release()
+            metrics.observe('llm_request_seconds', time.monotonic() - started, model=model, operation=operation)
+            metrics.increment('llm_requests_total', model=model, operation=operation, outcome="completed")
+            if getattr(response, 'usage', None) is not None:
+                self._record_usage(model, response.usage)
+            return response
+
+    def _backoff(self, error, attempt, model, operation, deadline_at):
+        # Sleeps before the next attempt, or re-raises when the error is final.
+        retryable, retry_after = _retry_policy(error)
+        # Full jitter keeps callers that failed together from retrying together.
+        delay = retry_after if retry_after is not None else random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)))
+        if not retryable or attempt == MAX_ATTEMPTS:
+            metrics.increment('llm_requests_total', model=model, operation=operation, outcome="error")
+            raise error
+        if time.monotonic() + delay >= deadline_at:
+            metrics.increment('llm_requests_total', model=model, operation=operation, outcome="timeout")
+            raise LLMTimeout(f"{model} {operation} request ran out of time after {attempt} attempts") from error
+        metrics.increment('llm_retries_total', model=model, operation=operation)
+        time.sleep(delay)
+
+    def _semaphore(self, model):
+        with self._lock:
+            if model not in self._semaphores:
+                self._semaphores[model] = threading.BoundedSemaphore(self.model_concurrency.get(model, DEFAULT_CONCURRENCY))
+            return self._semaphores[model]
+
+    def _acquire(self, semaphore, model, deadline_at):
+        queued = time.monotonic()
+        if not semaphore.acquire(timeout=max(deadline_at - queued, 0)):
+            metrics.increment('llm_requests_total', model=model, operation="queue", outcome="timeout")
+            raise LLMTimeout(f"Timed out waiting for a {model} slot")
+        metrics.observe('llm_queue_seconds', time.monotonic() - queued, model=model)
+
+    def _throttle(self, user_id, deadline_at):
+        if user_id is None:
+            return
+        with self._lock:
+            bucket = self._buckets.get(user_id)
+            if bucket is None:
+                bucket = self._buckets[user_id] = TokenBucket(self.user_rate, self.user_burst)
+            self._buckets.move_to_end(user_id)
+            while len(self._buckets) > USER_BUCKETS_MAX_ENTRIES:
+                self._buckets.popitem(last=False)
+        wait = bucket.reserve()
+        if time.monotonic() + wait > deadline_at:
+            bucket.refund()
+            metrics.increment('llm_rate_limited_total')
+            raise LLMRateLimited(wait)
+        if wait:
+            time.sleep(wait)
+
+    def _record_usage(self, model, usage):
+        metrics.increment('llm_tokens_total', usage.prompt_tokens or 0, model=model, kind="prompt")
+        metrics.increment('llm_tokens_total', usage.completion_tokens or 0, model=model, kind="completion")
+
+def _retry_policy(error):
+    # (retryable, server-requested delay): retry 429s, 5xx, timeouts and dropped connections.
+    import openai
+
+    if isinstance(error, openai.APIStatusError):
+        if error.status_code != 429 and error.status_code < 500:
+            return False, None
+        try:
+            return True, float(error.response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return True, None
+    return isinstance(error, openai.APIConnectionError), None
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway():
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
@@ -1,11 +1,14 @@
+import os
 import streamlit as st
 from auth import login, register, logout
-from patient import patient_flow
-from professional import professional_flow
-from admin import admin_flow
-from create_users_table import create_users_table
-from create_activities_table import create_activities_table
-from create_mood_journal_table import create_mood_journal_table
+from migrate import run_migrations, report_unindexed_queries
+import metrics
+from query_trace import rerun_trace
+from profiler import profile_rerun
+
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9464"))
+# Set to 0.0.0.0 (or a private interface) only where the port is firewalled to the scraper.
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
 
 # Initialize the app
 st.set_page_config(page_title="Snuggli - Mental Health Support", layout="wide")
@@ -30,54 +33,87 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+@st.cache_resource
 def initialize_database():
-    create_users_table()
-    create_activities_table()
-    create_mood_journal_table()
+    # Runs once per server process rather than on every rerun. Returns the migration error, if any,
+    # so it can be shown to admins instead of only reaching the server log.
+    error = None
+    try:
+        run_migrations()
+    except Exception as e:
+        print(f"Error running migrations: {str(e)}")
+        metrics.increment('schema_migration_failures_total')
+        error = str(e)
+    report_unindexed_queries()
+    return error
+
+@st.cache_resource
+def start_metrics_endpoint():
+    # One Prometheus endpoint per server process; METRICS_PORT=0 disables it.
+    if not METRICS_PORT:
+        return None
+    try:
+        return metrics.start_metrics_server(METRICS_PORT, METRICS_HOST)
+    except OSError as e:
+        print(f"Error starting metrics endpoint on port {METRICS_PORT}: {str(e)}")
+        return None
 
 def main():
-    initialize_database()
+    migration_error = initialize_database()
+    start_metrics_endpoint()
+    
+    user = st.session_state.get('user')
+    if migration_error and user and user['user_type'] == 'admin':
+        st.error(f"Database schema is out of date. {migration_error}")
+    page = user['user_type'] if user else "login"
+    # Queries issued while rendering are recorded against this page (see the admin Performance tab);
+    # with PROFILE_RERUNS=1, or ?profile=1 for an admin, the rerun is profiled too.
+    with rerun_trace(page), profile_rerun(page):
     
-    # Sidebar
-    with st.sidebar:
-        st.image("assets/logo.svg", width=200)
-        st.title("Snuggli")
+        # Sidebar
+        with st.sidebar:
+            st.image("assets/logo.svg", width=200)
+            st.title("Snuggli")
         
-        if 'user' in st.session_state and st.session_state.user:
-            st.write(f"Logged in as: {st.session_state.user['email']}")
-            if st.button("Logout", key="logout_button"):
-                logout()
+            if 'user' in st.session_state and st.session_state.user:
+                st.write(f"Logged in as: {st.session_state.user['email']}")
+                if st.button("Logout", key="logout_button"):
+                    logout()
     
-    if 'user' not in st.session_state or st.session_state.user is None:
-        st.title("Welcome to Snuggli")
-        st.write("Your mental health companion")
+        if 'user' not in st.session_state or st.session_state.user is None:
+            st.title("Welcome to Snuggli")
+            st.write("Your mental health companion")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            st.markdown("""
-            <div class="card bg-secondary">
-                <div class="card-body">
-                    <h3 class="card-title">Login</h3>
-                    """, unsafe_allow_html=True)
-            login()
-            st.markdown("</div></div>", unsafe_allow_html=True)
-        with col2:
-            st.markdown("""
-            <div class="card bg-secondary">
-                <div class="card-body">
-                    <h3 class="card-title">Register</h3>
-                    """, unsafe_allow_html=True)
-            register()
-            st.markdown("</div></div>", unsafe_allow_html=True)
-    else:
-        if st.session_state.user['user_type'] == 'patient':
-            patient_flow()
-        elif st.session_state.user['user_type'] == 'professional':
-            professional_flow()
-        elif st.session_state.user['user_type'] == 'admin':
-            admin_flow()
+            col1, col2 = st.columns(2)
+            with col1:
+                st.markdown("""
+                <div class="card bg-secondary">
+                    <div class="card-body">
+                        <h3 class="card-title">Login</h3>
+                        """, unsafe_allow_html=True)
+                login()
+                st.markdown("</div></div>", unsafe_allow_html=True)
+            with col2:
+                st.markdown("""
+                <div class="card bg-secondary">
+                    <div class="card-body">
+                        <h3 class="card-title">Register</h3>
+                        """, unsafe_allow_html=True)
+                register()
+                st.markdown("</div></div>", unsafe_allow_html=True)
         else:
-            st.error("Invalid user type. Please contact support.")
+            # Role flows are imported on first use so a session only loads the code its role needs.
+            if st.session_state.user['user_type'] == 'patient':
+                from patient import patient_flow
+                patient_flow()
+            elif st.session_state.user['user_type'] == 'professional':
+                from professional import professional_flow
+                professional_flow()
+            elif st.session_state.user['user_type'] == 'admin':
+                from admin import admin_flow
+                admin_flow()
+            else:
+                st.error("Invalid user type. Please contact support.")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+import bisect
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Small in-process metrics registry shared by every module (counters and fixed-bucket histograms).
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def increment(name, value=1, **labels):
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+def observe(name, value, buckets=LATENCY_BUCKETS, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+        histogram['counts'][bisect.bisect_left(histogram['buckets'], value)] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+def snapshot():
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {**histogram, 'counts': list(histogram['counts'])} for key, histogram in _histograms.items()}
+    return counters, histograms
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+def quantile(histogram, q):
+    # Upper bound of the bucket holding the q-th quantile (the last finite bound for the overflow bucket).
+    if not histogram['count']:
+        return None
+    target = q * histogram['count']
+    cumulative = 0
+    for i, count in enumerate(histogram['counts']):
+        cumulative += count
+        if cumulative >= target:
+            return histogram['buckets'][min(i, len(histogram['buckets']) - 1)]
+    return histogram['buckets'][-1]
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+def render_prometheus():
+    # Prometheus text exposition format (version 0.0.4).
+    counters, histograms = snapshot()
+    grouped_counters, grouped_histograms = defaultdict(list), defaultdict(list)
+    for (name, labels), value in counters.items():
+        grouped_counters[name].append((labels, value))
+    for (name, labels), histogram in histograms.items():
+        grouped_histograms[name].append((labels, histogram))
+    lines = []
+    for name, series in sorted(grouped_counters.items()):
+        lines.append(f"# TYPE {name} counter")
+        for labels, value in sorted(series, key=lambda item: repr(item[0])):
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+    for name, series in sorted(grouped_histograms.items()):
+        lines.append(f"# TYPE {name} histogram")
+        for labels, histogram in sorted(series, key=lambda item: repr(item[0])):
+            cumulative = 0
+            for bound, count in zip(list(histogram['buckets']) + ["+Inf"], histogram['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']:g}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port, host="127.0.0.1"):
+    # Serves GET /metrics from a daemon thread; returns the server. The endpoint has no
+    # authentication, so it listens on loopback unless told otherwise.
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+    return server
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import re
+import sys
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+MIGRATIONS_DIR = Path(__file__).parent / "migrations"
+MIGRATION_LOCK_ID = 4815162342
+
+# Queries the app runs on every page load: (description, table, equality columns, order columns).
+HOT_QUERIES = [
+    ("mood history", "mood_journal", ["user_id"], ["created_at"]),
+    ("user activities", "activities", ["user_id"], ["created_at"]),
+    ("latest professional input", "professional_inputs", ["user_id"], ["created_at"]),
+    ("reports by patient", "reports", ["user_id"], ["created_at"]),
+    ("professional's upcoming appointments", "appointments", ["professional_id"], ["appointment_date", "appointment_time"]),
+    ("patient's appointments", "appointments", ["patient_id"], ["appointment_date", "appointment_time"]),
+    ("users by role", "users", ["user_type"], []),
+    ("user typeahead", "users", ["email"], []),
+    ("professional's caseload", "appointments", ["professional_id", "patient_id"], []),
+    ("daily signups", "users", [], ["created_at"]),
+    ("admin user pages", "users", [], ["created_at", "id"]),
+    ("admin user pages by role", "users", ["user_type"], ["created_at", "id"]),
+    ("admin user pages by status", "users", ["status"], ["created_at", "id"]),
+    ("chat history", "chat_messages", ["user_id"], ["created_at"]),
+]
+
+INDEX_PATTERN = re.compile(
+    r"create\s+(?:unique\s+)?index\s+(?:concurrently\s+)?(?:if\s+not\s+exists\s+)?(\w+)\s+"
+    r"on\s+(?:only\s+)?(?:\w+\.)?(\w+)\s+(?:using\s+\w+\s*)?\(([^;]*?)\)\s*(?:include|where|;|$)",
+    re.IGNORECASE,
+)
+
+class MigrationError(Exception):
+    pass
+
+def load_migrations():
+    migrations = []
+    for path in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        version, _, name = path.stem.partition("_")
+        sql = path.read_text()
+        checksum = hashlib.sha256(sql.encode()).hexdigest()
+        migrations.append((int(version), name, sql, checksum))
+    versions = [migration[0] for migration in migrations]
+    if len(versions) != len(set(versions)):
+        raise ValueError("Duplicate migration version in migrations/")
+    return migrations
+
+def run_migrations(database_url=DATABASE_URL):
+    if not database_url:
+        print("DATABASE_URL not set; skipping schema migrations")
+        return []
+
+    import psycopg
+
+    applied_now = []
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        # Session-level lock so replicas starting together apply each migration once.
+        conn.execute("select pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            conn.execute(
+                "create table if not exists schema_migrations ("
+                "version integer primary key, name text not null, checksum text not null, "
+                "applied_at timestamptz not null default now())"
+            )
+            applied = {
+                version: checksum
+                for version, checksum in conn.execute("select version, checksum from schema_migrations").fetchall()
+            }
+            for version, name, sql, checksum in load_migrations():
+                if version in applied:
+                    if applied[version] != checksum:
+                        print(f"Warning: migration {version}_{name} changed after it was applied")
+                    continue
+                # Later migrations may depend on this one, so the first failure stops the run.
+                try:
+                    with conn.transaction():
+                        conn.execute(sql)
+                        conn.execute(
+                            "insert into schema_migrations (version, name, checksum) values (%s, %s, %s)",
+                            (version, name, checksum),
+                        )
+                except Exception as e:
+                    raise MigrationError(f"Migration {version}_{name} failed: {str(e)}") from e
+                print(f"Applied migration {version}_{name}")
+                applied_now.append(version)
+        finally:
+            conn.execute("select pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+    return applied_now
+
+def parse_indexes(sql):
+    indexes = []
+    for name, table, columns in INDEX_PATTERN.findall(sql):
+        column_names = [re.split(r"\s+", column.strip())[0].strip('"').lower() for column in columns.split(",")]
+        indexes.append((name, table.lower(), column_names))
+    return indexes
+
+def declared_indexes():
+    indexes = []
+    for _, _, sql, _ in load_migrations():
+        indexes.extend(parse_indexes(sql))
+    return indexes
+
+def live_indexes(database_url=DATABASE_URL):
+    import psycopg
+
+    with psycopg.connect(database_url) as conn:
+        rows = conn.execute("select indexdef from pg_indexes where schemaname = 'public'").fetchall()
+    return parse_indexes(";\n".join(row[0] for row in rows) + ";")
+
+def index_serves(columns, equality_columns, order_columns):
+    # Equality columns must lead the index (in any order), followed by the sort columns in order.
+    leading = columns[:len(equality_columns)]
+    if sorted(leading) != sorted(equality_columns):
+        return False
+    return columns[len(equality_columns):len(equality_columns) + len(order_columns)] == order_columns
+
+def check_query_indexes(indexes=None):
+    if indexes is None:
+        indexes = declared_indexes()
+    unindexed = []
+    for description, table, equality_columns, order_columns in HOT_QUERIES:
+        if not any(
+            index_table == table and index_serves(columns, equality_columns, order_columns)
+            for _, index_table, columns in indexes
+        ):
+            unindexed.append((description, table, equality_columns, order_columns))
+    return unindexed
+
+def report_unindexed_queries(indexes=None):
+    unindexed = check_query_indexes(indexes)
+    for description, table, equality_columns, order_columns in unindexed:
+        print(f"Warning: no index on {table} serves '{description}' "
+              f"(filter: {', '.join(equality_columns) or '-'}; order: {', '.join(order_columns) or '-'})")
+    return unindexed
+
+if __name__ == "__main__":
+    if "--check" in sys.argv:
+        live = "--live" in sys.argv and DATABASE_URL
+        sys.exit(1 if report_unindexed_queries(live_indexes() if live else None) else 0)
+    try:
+        run_migrations()
+    except MigrationError as e:
+        print(f"Error: {str(e)}")
+        sys.exit(1)
@@ -0,0 +1,54 @@
+-- Baseline schema for every table the app reads or writes.
+create table if not exists users (
+    id uuid primary key,
+    email text not null unique,
+    user_type text not null default 'patient',
+    status text not null default 'active',
+    created_at timestamptz not null default now()
+);
+
+create table if not exists reports (
+    id bigint generated by default as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    summary text,
+    status text not null default 'unreviewed',
+    urgency text not null default 'low',
+    professional_notes text,
+    created_at timestamptz not null default now(),
+    updated_at timestamptz
+);
+
+create table if not exists appointments (
+    id bigint generated by default as identity primary key,
+    patient_id uuid not null references users (id) on delete cascade,
+    professional_id uuid not null references users (id) on delete cascade,
+    appointment_date date not null,
+    appointment_time time not null,
+    status text not null default 'scheduled',
+    created_at timestamptz not null default now()
+);
+
+create table if not exists professional_inputs (
+    id bigint generated by default as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    input text not null,
+    created_at timestamptz not null default now()
+);
+
+create table if not exists mood_journal (
+    id bigint generated by default as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    mood smallint not null,
+    journal_entry text,
+    created_at timestamptz not null default now()
+);
+
+create table if not exists activities (
+    id bigint generated by default as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    activity_name text not null,
+    description text,
+    benefit text,
+    status text not null default 'pending',
+    created_at timestamptz not null default now()
+);
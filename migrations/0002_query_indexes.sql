@@ -0,0 +1,10 @@
+-- Composite indexes matching the app's hot access paths: filter on the owning
+-- user/professional, then read newest-first or in calendar order.
+create index if not exists mood_journal_user_created_idx on mood_journal (user_id, created_at desc);
+create index if not exists activities_user_created_idx on activities (user_id, created_at desc);
+create index if not exists professional_inputs_user_created_idx on professional_inputs (user_id, created_at desc);
+create index if not exists reports_user_created_idx on reports (user_id, created_at desc);
+create index if not exists appointments_professional_date_idx on appointments (professional_id, appointment_date, appointment_time);
+create index if not exists appointments_patient_date_idx on appointments (patient_id, appointment_date, appointment_time);
+create index if not exists users_user_type_idx on users (user_type);
+create index if not exists users_created_idx on users (created_at);
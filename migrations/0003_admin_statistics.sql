@@ -0,0 +1,33 @@
+-- Aggregates for the admin "System Statistics" tab, computed server-side so the
+-- dashboard receives a single small JSON document instead of whole tables.
+create or replace function public.admin_statistics(signup_days integer default 30)
+returns jsonb
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select jsonb_build_object(
+        'total_users', (select count(*) from users),
+        'users_by_type', coalesce(
+            (select jsonb_object_agg(user_type, total)
+             from (select user_type, count(*) as total from users group by user_type) as by_type),
+            '{}'::jsonb),
+        'total_reports', (select count(*) from reports),
+        'total_appointments', (select count(*) from appointments),
+        'daily_signups', coalesce(
+            (select jsonb_object_agg(signup_date, total)
+             from (select to_char(created_at::date, 'YYYY-MM-DD') as signup_date, count(*) as total
+                   from users
+                   where created_at >= now() - make_interval(days => signup_days)
+                   group by 1) as by_day),
+            '{}'::jsonb),
+        'activity_distribution', coalesce(
+            (select jsonb_object_agg(status, total)
+             from (select status, count(*) as total from activities group by status) as by_status),
+            '{}'::jsonb)
+    );
+$$;
+
+revoke execute on function public.admin_statistics(integer) from public, anon;
+grant execute on function public.admin_statistics(integer) to authenticated, service_role;
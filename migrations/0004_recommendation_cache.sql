@@ -0,0 +1,9 @@
+-- AI activity recommendations keyed by a hash of the inputs that produced them,
+-- so unchanged inputs never trigger another completion.
+create table if not exists recommendation_cache (
+    user_id uuid not null references users (id) on delete cascade,
+    input_hash text not null,
+    recommendation text not null,
+    created_at timestamptz not null default now(),
+    primary key (user_id, input_hash)
+);
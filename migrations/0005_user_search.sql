@@ -0,0 +1,40 @@
+-- Server-side typeahead over users.email / users.display_name backed by trigram
+-- indexes, so pickers load one page of matches instead of every user.
+create extension if not exists pg_trgm;
+
+alter table users add column if not exists display_name text;
+
+create index if not exists users_email_trgm_idx on users using gin (email gin_trgm_ops);
+create index if not exists users_display_name_trgm_idx on users using gin (display_name gin_trgm_ops);
+create index if not exists users_type_email_idx on users (user_type, email);
+create index if not exists appointments_professional_patient_idx on appointments (professional_id, patient_id);
+
+create or replace function public.search_users(
+    search text default '',
+    role text default null,
+    caseload_of uuid default null,
+    page_size integer default 20,
+    page_offset integer default 0
+)
+returns table (id uuid, email text, display_name text, user_type text)
+language sql
+stable
+set search_path = public
+as $$
+    with term as (
+        select replace(replace(replace(coalesce(search, ''), '\', '\\'), '%', '\%'), '_', '\_') as escaped
+    )
+    select u.id, u.email, u.display_name, u.user_type
+    from users u, term
+    where (role is null or u.user_type = role)
+      and (term.escaped = ''
+           or u.email ilike '%' || term.escaped || '%'
+           or u.display_name ilike '%' || term.escaped || '%')
+      and (caseload_of is null or exists (
+           select 1 from appointments a
+           where a.professional_id = caseload_of and a.patient_id = u.id))
+    -- Prefix matches first, then alphabetical.
+    order by (u.email ilike term.escaped || '%') desc, u.email
+    limit least(page_size, 100)
+    offset greatest(page_offset, 0);
+$$;
@@ -0,0 +1,5 @@
+-- Keyset pagination for the admin user list: newest first on (created_at, id),
+-- optionally filtered by role or status.
+create index if not exists users_created_id_idx on users (created_at desc, id desc);
+create index if not exists users_type_created_id_idx on users (user_type, created_at desc, id desc);
+create index if not exists users_status_created_id_idx on users (status, created_at desc, id desc);
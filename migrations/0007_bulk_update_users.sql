@@ -0,0 +1,37 @@
+-- Applies a batch of admin user edits in one statement (and so one transaction),
+-- returning a result per requested row.
+create or replace function public.bulk_update_users(changes jsonb)
+returns table (id uuid, updated boolean, error text)
+language sql
+volatile
+set search_path = public
+as $$
+    with requested as (
+        select (c ->> 'id')::uuid as id, c ->> 'status' as status, c ->> 'user_type' as user_type
+        from jsonb_array_elements(changes) as c
+    ),
+    valid as (
+        select requested.*
+        from requested
+        where coalesce(requested.status, 'active') in ('active', 'inactive')
+          and coalesce(requested.user_type, 'patient') in ('patient', 'professional', 'admin')
+    ),
+    applied as (
+        update users u
+        set status = coalesce(valid.status, u.status),
+            user_type = coalesce(valid.user_type, u.user_type)
+        from valid
+        where u.id = valid.id
+        returning u.id
+    )
+    select requested.id,
+           applied.id is not null,
+           case
+               when applied.id is not null then null
+               when valid.id is null then 'invalid status or user type'
+               else 'user not found'
+           end
+    from requested
+    left join valid on valid.id = requested.id
+    left join applied on applied.id = requested.id;
+$$;
@@ -0,0 +1,4 @@
+-- Client-generated keys for rows written through the write-behind buffer, so a
+-- batch replayed after a crash is inserted at most once.
+alter table mood_journal add column if not exists client_ref uuid unique;
+alter table activities add column if not exists client_ref uuid unique;
@@ -0,0 +1,41 @@
+-- Reject double bookings in the database: a professional or a patient cannot hold
+-- two overlapping, non-cancelled appointments.
+create extension if not exists btree_gist;
+
+alter table appointments add column if not exists duration_minutes integer not null default 60;
+alter table appointments add column if not exists slot tsrange generated always as (
+    tsrange(appointment_date + appointment_time,
+            appointment_date + appointment_time + make_interval(mins => duration_minutes))
+) stored;
+
+-- Overlaps booked before this constraint existed would make it fail. Migrations never change
+-- appointments themselves: the migration stops and lists them, and an operator resolves them
+-- (python resolve_appointment_overlaps.py) before it is retried.
+do $$
+declare
+    conflicts text;
+    total integer;
+begin
+    select count(*), string_agg(format('%s overlaps %s', later_id, earlier_id), ', ' order by later_id)
+           filter (where rank <= 50)
+      into total, conflicts
+    from (
+        select later.id as later_id, earlier.id as earlier_id, row_number() over (order by later.id, earlier.id) as rank
+        from appointments later
+        join appointments earlier
+          on earlier.id <> later.id
+         and (earlier.professional_id = later.professional_id or earlier.patient_id = later.patient_id)
+         and earlier.slot && later.slot
+         and (earlier.created_at, earlier.id) < (later.created_at, later.id)
+        where later.status <> 'cancelled' and earlier.status <> 'cancelled'
+    ) overlaps;
+    if total > 0 then
+        raise exception '% overlapping appointment pair(s) block the no-overlap constraints: %', total, conflicts
+            using hint = 'Review them with python resolve_appointment_overlaps.py, then rerun the migrations.';
+    end if;
+end $$;
+
+alter table appointments add constraint appointments_professional_no_overlap
+    exclude using gist (professional_id with =, slot with &&) where (status <> 'cancelled');
+alter table appointments add constraint appointments_patient_no_overlap
+    exclude using gist (patient_id with =, slot with &&) where (status <> 'cancelled');
@@ -0,0 +1,16 @@
+-- Stream row changes on the dashboard tables to Supabase Realtime (see change_feed.py).
+do $$
+begin
+    if exists (select 1 from pg_publication where pubname = 'supabase_realtime') then
+        if not exists (select 1 from pg_publication_tables where pubname = 'supabase_realtime' and tablename = 'reports') then
+            alter publication supabase_realtime add table reports;
+        end if;
+        if not exists (select 1 from pg_publication_tables where pubname = 'supabase_realtime' and tablename = 'appointments') then
+            alter publication supabase_realtime add table appointments;
+        end if;
+        if not exists (select 1 from pg_publication_tables where pubname = 'supabase_realtime' and tablename = 'activities') then
+            alter publication supabase_realtime add table activities;
+        end if;
+    end if;
+end
+$$;
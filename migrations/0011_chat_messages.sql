@@ -0,0 +1,12 @@
+-- Persisted AI Listener transcripts. Rows are only ever appended, in batches through the
+-- write-behind buffer, so client_ref makes a replayed batch insert each message once.
+create table if not exists chat_messages (
+    id bigint generated by default as identity primary key,
+    user_id uuid not null references users (id) on delete cascade,
+    role text not null check (role in ('user', 'assistant')),
+    content text not null,
+    client_ref uuid unique,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists chat_messages_user_created_idx on chat_messages (user_id, created_at desc);
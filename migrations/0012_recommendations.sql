@@ -0,0 +1,33 @@
+-- Latest activity recommendation per patient, precomputed by batch_recommendations.py.
+-- inputs_as_of is when the moods and professional input it was generated from were read;
+-- anything newer makes the patient due for the next batch run.
+create table if not exists recommendations (
+    user_id uuid primary key references users (id) on delete cascade,
+    input_hash text not null,
+    recommendation text not null,
+    inputs_as_of timestamptz not null,
+    generated_at timestamptz not null default now()
+);
+
+-- Replaced by recommendations: staleness is now detected by input hash, not invalidation.
+drop table if exists recommendation_cache;
+
+create or replace function patients_needing_recommendations(after_id uuid default null, page_size integer default 500)
+returns table (id uuid)
+language sql stable
+as $$
+    select u.id
+    from users u
+    left join recommendations r on r.user_id = u.id
+    where u.user_type = 'patient'
+      and u.status = 'active'
+      and (after_id is null or u.id > after_id)
+      and (
+          exists (select 1 from mood_journal m
+                  where m.user_id = u.id and (r.inputs_as_of is null or m.created_at > r.inputs_as_of))
+          or exists (select 1 from professional_inputs p
+                     where p.user_id = u.id and r.inputs_as_of is not null and p.created_at > r.inputs_as_of)
+      )
+    order by u.id
+    limit page_size;
+$$;
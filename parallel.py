@@ -0,0 +1,18 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Shared pool for issuing a page's independent queries at the same time.
+# Tasks must not call Streamlit APIs; they run outside the script thread.
+MAX_WORKERS = 16
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="snuggli-io")
+
+def submit(fn, *args, **kwargs):
+    context = contextvars.copy_context()
+    return _executor.submit(context.run, partial(fn, *args, **kwargs))
+
+def gather(timeout=None, **tasks):
+    # gather(user=lambda: ..., moods=lambda: ...) -> {'user': ..., 'moods': ...}
+    futures = {name: submit(task) for name, task in tasks.items()}
+    return {name: future.result(timeout=timeout) for name, future in futures.items()}
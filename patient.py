@@ -1,9 +1,15 @@
 import streamlit as st
 from database import supabase_client
-from ai_listener import chat_with_ai
+from ai_listener import stream_chat_with_ai, audio_input
+from summarizer import get_conversation_summary, record_turns, fold_evicted
+from chat_history import get_chat_history, load_older, append_message, CHAT_MAX_LOADED
 from utils import schedule_appointment
+from availability import get_availability
+from directory import get_directory
 from activity_recommender import activity_recommendation_system
-from datetime import datetime
+from write_buffer import get_write_buffer
+from tabs import render_tabs, tab_fragment, tab_cache, clear_tab_cache
+from datetime import datetime, timezone
 
 def patient_flow():
     st.title(f"Welcome, {st.session_state.user['email']}")
@@ -21,69 +27,92 @@ def patient_flow():
         unsafe_allow_html=True
     )
     
-    tab1, tab2, tab3, tab4 = st.tabs(tabs)
-    
-    with tab1:
-        chat_with_ai_listener()
-    
-    with tab2:
-        schedule_appointment_tab()
-    
-    with tab3:
-        mood_tracker_and_journal()
-    
-    with tab4:
-        activity_recommendation_system(st.session_state.user['id'])
+    render_tabs("patient", dict(zip(tabs, [chat_with_ai_listener, schedule_appointment_tab,
+                                           mood_tracker_and_journal, activities_tab])))
 
+@tab_fragment
 def chat_with_ai_listener():
     st.subheader("Chat with AI Listener")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
-    if 'messages' not in st.session_state:
-        st.session_state.messages = []
+    history = get_chat_history(st.session_state, st.session_state.user['id'])
+    if history.has_older and len(history.messages) < CHAT_MAX_LOADED:
+        st.button("Load older messages", key="chat_load_older", on_click=load_older, args=(history,))
 
-    for message in st.session_state.messages:
+    for message in history.messages:
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
 
-    if prompt := st.chat_input("What's on your mind?"):
-        st.session_state.messages.append({"role": "user", "content": prompt})
+    with st.expander("Speak instead of typing"):
+        voice_prompt = audio_input()
+
+    if prompt := st.chat_input("What's on your mind?") or voice_prompt:
+        # Context for the reply: the turns before this one plus the session's rolling summary
+        earlier_turns = list(history.messages)
+        conversation_summary = get_conversation_summary(st.session_state, st.session_state.user['id'])
+        user_message = append_message(history, "user", prompt)
         with st.chat_message("user"):
             st.markdown(prompt)
 
+        context_stats = {}
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
-            full_response = chat_with_ai(prompt)
-            message_placeholder.markdown(full_response)
-        st.session_state.messages.append({"role": "assistant", "content": full_response})
+            try:
+                with message_placeholder.container():
+                    full_response = st.write_stream(stream_chat_with_ai(
+                        prompt, user_id=st.session_state.user['id'], history=earlier_turns,
+                        summary=conversation_summary.summary, context_stats=context_stats
+                    ))
+            except Exception as e:
+                full_response = ""
+                message_placeholder.error(f"The AI Listener is unavailable right now: {str(e)}")
+        if context_stats.get('evicted_turns'):
+            fold_evicted(conversation_summary, context_stats['included_turns'])
+        if full_response:
+            assistant_message = append_message(history, "assistant", full_response)
+            # Folded into the session's report in the background, a few turns at a time
+            record_turns(conversation_summary, [user_message, assistant_message])
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
+@tab_fragment
 def schedule_appointment_tab():
     st.subheader("Schedule an Appointment")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
-    professionals = supabase_client.table('users').select('id', 'email').eq('user_type', 'professional').execute()
+    professionals = get_directory('professional')
     
-    if professionals.data:
-        with st.form("schedule_appointment"):
-            professional = st.selectbox("Choose a professional", 
-                                        options=[p['email'] for p in professionals.data],
-                                        format_func=lambda x: x)
-            date = st.date_input("Select a date")
-            time = st.time_input("Select a time")
-            
-            if st.form_submit_button("Schedule", use_container_width=True):
-                professional_id = next(p['id'] for p in professionals.data if p['email'] == professional)
-                if schedule_appointment(st.session_state.user['id'], professional_id, date, time):
-                    st.success("Appointment scheduled successfully!")
-                else:
-                    st.error("Failed to schedule appointment. Please try again.")
+    if professionals.users:
+        # Outside the form so the free slots follow the chosen professional immediately.
+        professional = st.selectbox("Choose a professional", 
+                                    options=professionals.emails,
+                                    format_func=lambda x: x)
+        professional_id = professionals.id_for_email(professional)
+        free_slots = get_availability().next_free_slots(professional_id, count=12)
+        
+        if free_slots:
+            with st.form("schedule_appointment"):
+                slot = st.selectbox("Available times", options=free_slots,
+                                    format_func=lambda s: s.strftime("%a %d %b, %H:%M"))
+                
+                if st.form_submit_button("Schedule", use_container_width=True):
+                    conflict = get_availability().find_conflict(st.session_state.user['id'], professional_id, slot)
+                    if conflict == "professional":
+                        st.error("That time was just booked. Please choose another.")
+                    elif conflict == "patient":
+                        st.error("You already have an appointment at that time.")
+                    elif schedule_appointment(st.session_state.user['id'], professional_id, slot.date(), slot.time()):
+                        st.success("Appointment scheduled successfully!")
+                    else:
+                        st.error("Failed to schedule appointment. Please try again.")
+        else:
+            st.info("This professional has no free times in the next two weeks.")
     else:
         st.info("No professionals available at the moment. Please check back later.")
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
+@tab_fragment
 def mood_tracker_and_journal():
     st.subheader("Mood Tracker & Journal")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
@@ -109,22 +138,28 @@ def save_mood_and_journal(mood, journal_entry):
     user_id = st.session_state.user['id']
 
     try:
-        supabase_client.table('mood_journal').insert({
+        get_write_buffer().insert('mood_journal', {
             'user_id': user_id,
             'mood': mood,
             'journal_entry': journal_entry,
-            'created_at': datetime.now().isoformat()
-        }).execute()
+            'created_at': datetime.now(timezone.utc).isoformat()
+        })
+        clear_tab_cache("mood")
         st.success("Your mood and journal entry have been saved.")
     except Exception as e:
         st.error(f"Failed to save mood and journal entry: {str(e)}")
 
 def display_mood_history():
     try:
-        mood_history = supabase_client.table('mood_journal').select('*').eq('user_id', st.session_state.user['id']).order('created_at', desc=True).limit(10).execute()
+        user_id = st.session_state.user['id']
+        mood_history = tab_cache("mood", "history", lambda: get_write_buffer().merge_pending(
+            'mood_journal',
+            supabase_client.table('mood_journal').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(10).execute().data,
+            limit=10, user_id=user_id
+        ))
         
-        if mood_history.data:
-            data = [(entry['created_at'][:10], entry['mood']) for entry in mood_history.data]
+        if mood_history:
+            data = [(entry['created_at'][:10], entry['mood']) for entry in mood_history]
             dates, moods = zip(*data)
             
             st.line_chart(dict(zip(dates, moods)))
@@ -132,9 +167,13 @@ def display_mood_history():
             st.info("No mood history available yet. Start tracking your mood to see the chart.")
 
         st.subheader("Recent Journal Entries")
-        for entry in mood_history.data:
+        for entry in mood_history:
             with st.expander(f"Entry from {entry['created_at'][:10]}"):
                 st.write(f"Mood: {entry['mood']}/10")
                 st.write(entry['journal_entry'])
     except Exception as e:
         st.error(f"Failed to retrieve mood history: {str(e)}")
+
+@tab_fragment
+def activities_tab():
+    activity_recommendation_system(st.session_state.user['id'])
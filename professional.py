@@ -1,7 +1,13 @@
 import streamlit as st
 from database import supabase_client
+from identity import resolve_emails
+from change_feed import live_query, watch_queries
+from tabs import render_tabs, tab_fragment
+from user_search import patient_picker
+from write_buffer import get_write_buffer
+from availability import get_availability
 from utils import get_patient_reports, update_report_status, schedule_appointment
-from activity_recommender import professional_input_form, get_user_activities
+from activity_recommender import professional_input_form, get_user_activities, update_activity_status
 from datetime import datetime, timedelta
 
 def professional_flow():
@@ -20,22 +26,17 @@ def professional_flow():
         unsafe_allow_html=True
     )
     
-    tab1, tab2, tab3 = st.tabs(tabs)
-    
-    with tab1:
-        review_patient_reports()
-    
-    with tab2:
-        manage_appointments()
-    
-    with tab3:
-        manage_activity_recommendations()
+    render_tabs("professional", dict(zip(tabs, [review_patient_reports, manage_appointments,
+                                                manage_activity_recommendations])))
 
+@tab_fragment
 def review_patient_reports():
     st.subheader("Patient Reports")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
     reports = get_patient_reports()
+    # Refresh when another session changes a report.
+    watch_queries("patient_reports", 'reports')
     
     if reports:
         for report in reports:
@@ -66,71 +67,101 @@ def review_patient_reports():
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
+@tab_fragment
 def manage_appointments():
     st.subheader("Appointment Management")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
+    professional_id = st.session_state.user['id']
+    
     col1, col2 = st.columns(2)
     
     with col1:
         st.write("Schedule New Appointment")
-        patients = supabase_client.table('users').select('id', 'email').eq('user_type', 'patient').execute()
-        
-        if patients.data:
+        patient = patient_picker("appointment_patient", professional_id)
+        if patient:
+            patient_id = patient['id']
             with st.form("schedule_appointment"):
-                patient_email = st.selectbox("Select Patient", options=[p['email'] for p in patients.data])
-                patient_id = next(p['id'] for p in patients.data if p['email'] == patient_email)
-                
                 date = st.date_input("Select Date", min_value=datetime.now().date())
                 time = st.time_input("Select Time")
                 
                 if st.form_submit_button("Schedule Appointment", use_container_width=True):
-                    if schedule_appointment(patient_id, st.session_state.user['id'], date, time):
+                    conflict = get_availability().find_conflict(patient_id, professional_id, datetime.combine(date, time))
+                    if conflict == "professional":
+                        st.error("You already have an appointment at that time.")
+                    elif conflict == "patient":
+                        st.error("The patient already has an appointment at that time.")
+                    elif schedule_appointment(patient_id, professional_id, date, time):
                         st.success("Appointment scheduled successfully!")
                     else:
                         st.error("Failed to schedule appointment. Please try again.")
-        else:
-            st.info("No patients found in the system.")
     
     with col2:
         st.write("Upcoming Appointments")
-        appointments = (
-            supabase_client
-            .table('appointments')
-            .select('*')
-            .eq('professional_id', st.session_state.user['id'])
-            .gte('appointment_date', datetime.now().date().isoformat())
-            .order('appointment_date')
-            .order('appointment_time')
-            .execute()
-        )
+        appointments = get_upcoming_appointments(professional_id)
+        watch_queries("appointments", f"appointments:{professional_id}")
         
-        if appointments.data:
-            for appointment in appointments.data:
-                patient = supabase_client.table('users').select('email').eq('id', appointment['patient_id']).single().execute()
+        if appointments:
+            patient_emails = resolve_emails(appointment['patient_id'] for appointment in appointments)
+            for appointment in appointments:
                 with st.expander(f"{appointment['appointment_date']} - {appointment['appointment_time']}"):
-                    st.write(f"Patient: {patient.data['email']}")
+                    st.write(f"Patient: {patient_emails.get(appointment['patient_id'], 'Unknown patient')}")
                     st.write(f"Status: {appointment['status']}")
                     new_status = st.selectbox("Update Status", ["scheduled", "completed", "cancelled"], 
                                               index=["scheduled", "completed", "cancelled"].index(appointment['status']),
                                               key=f"appt_status_{appointment['id']}")
                     if st.button("Update Appointment", key=f"update_appt_{appointment['id']}", use_container_width=True):
-                        supabase_client.table('appointments').update({'status': new_status}).eq('id', appointment['id']).execute()
-                        st.success("Appointment status updated successfully!")
+                        if update_appointment_status(appointment['id'], new_status):
+                            st.success("Appointment status updated successfully!")
+                        else:
+                            st.error("Failed to update appointment. Please try again.")
         else:
             st.info("No upcoming appointments scheduled.")
     
     st.markdown('</div></div>', unsafe_allow_html=True)
 
+def update_appointment_status(appointment_id, new_status):
+    if new_status == "cancelled":
+        # Written straight to the database: the slot is freed in the index at once, and a new booking
+        # in it must not reach the database before the cancellation does.
+        try:
+            supabase_client.table('appointments').update({'status': new_status}).eq('id', appointment_id).execute()
+        except Exception as e:
+            print(f"Error cancelling appointment: {str(e)}")
+            return False
+        get_availability().released(appointment_id)
+    # Buffered as well, so it supersedes any status change for this appointment still waiting in the buffer.
+    get_write_buffer().update('appointments', appointment_id, {'status': new_status})
+    return True
+
+def get_upcoming_appointments(professional_id):
+    today = datetime.now().date().isoformat()
+    appointments = live_query(
+        f"appointments:{professional_id}", 'appointments',
+        lambda: (
+            supabase_client
+            .table('appointments')
+            .select('*')
+            .eq('professional_id', professional_id)
+            .gte('appointment_date', datetime.now().date().isoformat())
+            .execute()
+            .data
+        ),
+        lambda appointment: appointment.get('professional_id') == professional_id
+    ).rows()
+    appointments = sorted((appointment for appointment in appointments if appointment['appointment_date'] >= today),
+                          key=lambda appointment: (appointment['appointment_date'], appointment['appointment_time']))
+    return get_write_buffer().overlay('appointments', appointments)
+
+@tab_fragment
 def manage_activity_recommendations():
     st.subheader("Activity Recommendations")
     st.markdown('<div class="card bg-secondary"><div class="card-body">', unsafe_allow_html=True)
     
-    patients = supabase_client.table('users').select('id', 'email').eq('user_type', 'patient').execute()
+    selected_patient = patient_picker("activity_patient", st.session_state.user['id'], label="Select a patient")
     
-    if patients.data:
-        selected_patient = st.selectbox("Select a patient", options=[p['email'] for p in patients.data], format_func=lambda x: x)
-        selected_patient_id = next(p['id'] for p in patients.data if p['email'] == selected_patient)
+    if selected_patient:
+        selected_patient_id = selected_patient['id']
         
         col1, col2 = st.columns(2)
         
@@ -141,21 +172,23 @@ def manage_activity_recommendations():
         with col2:
             st.write("Patient's Current Activities")
             activities = get_user_activities(selected_patient_id)
-            if activities.data:
-                for activity in activities.data:
+            watch_queries("patient_activities", f"activities:{selected_patient_id}")
+            if activities:
+                for activity in activities:
                     with st.expander(f"{activity['activity_name']} - {activity['status']}"):
                         st.write(f"Description: {activity['description']}")
                         st.write(f"Benefit: {activity['benefit']}")
                         st.write(f"Created at: {activity['created_at']}")
+                        if activity.get('id') is None:
+                            st.caption("Saving...")
+                            continue
                         new_status = st.selectbox("Update status", ["pending", "in_progress", "completed"], 
                                                   index=["pending", "in_progress", "completed"].index(activity['status']),
                                                   key=f"act_status_{activity['id']}")
                         if st.button("Update Activity Status", key=f"update_act_{activity['id']}", use_container_width=True):
-                            supabase_client.table('activities').update({'status': new_status}).eq('id', activity['id']).execute()
+                            update_activity_status(activity['id'], new_status)
                             st.success("Activity status updated successfully!")
             else:
                 st.info("No activities found for this patient.")
-    else:
-        st.info("No patients found in the system.")
     
     st.markdown('</div></div>', unsafe_allow_html=True)
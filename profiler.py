@@ -0,0 +1,210 @@
+import contextvars
+import cProfile
+import json
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import streamlit as st
+import metrics
+
+# Opt-in rerun profiling. PROFILE_RERUNS=1 profiles every rerun on this server; an admin can
+# profile just their own session by opening the app with ?profile=1.
+PROFILE_ALL = os.environ.get("PROFILE_RERUNS", "").lower() in ("1", "true", "yes")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL_SECONDS = 0.005
+# Every profiled rerun goes to recent/, which keeps only the latest few. Reruns at or above this
+# percentile of recent durations go to slow/ and are kept much longer.
+PROFILE_KEEP_PERCENTILE = 95
+PROFILE_WINDOW = 500
+PROFILE_MIN_RERUNS = 20
+PROFILE_KEEP_RECENT = 50
+PROFILE_KEEP_SLOW = 200
+# Samples are attributed to the flow and tab functions in these modules.
+FLOW_MODULES = ("patient.py", "professional.py", "admin.py")
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_active = contextvars.ContextVar('rerun_profile', default=None)
+_durations = deque(maxlen=PROFILE_WINDOW)
+_durations_lock = threading.Lock()
+_files_lock = threading.Lock()
+
+def profiling_requested():
+    if PROFILE_ALL:
+        return True
+    user = st.session_state.get('user')
+    return bool(user) and user['user_type'] == 'admin' and st.query_params.get('profile') == "1"
+
+class StackSampler:
+    # Samples one thread's Python stack on a timer and counts collapsed stacks for flamegraphs.
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rerun-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = _collapse(frame) if frame is not None else None
+            if stack:
+                self.stacks[stack] += 1
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        stack.append(frame.f_code)
+        frame = frame.f_back
+    stack.reverse()
+    if any(code.co_filename == __file__ for code in stack):
+        # Caught while the profiler itself was starting or stopping.
+        return None
+    # Drop Streamlit's script runner above the first frame of app code.
+    first = next((i for i, code in enumerate(stack) if _in_app(code.co_filename)), 0)
+    return tuple(stack[first:])
+
+def _in_app(filename):
+    return filename.startswith(APP_DIR) and os.sep + "site-packages" + os.sep not in filename
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+def _category(stack):
+    # The innermost recognisable frame decides where the time went.
+    for code in reversed(stack):
+        path = code.co_filename
+        if path.endswith("query_trace.py") or any(f"{os.sep}{package}{os.sep}" in path for package in ("postgrest", "supabase", "gotrue", "supabase_auth", "realtime")):
+            return "supabase"
+        if path.endswith("llm_gateway.py") or f"{os.sep}openai{os.sep}" in path:
+            return "openai"
+        if "importlib._bootstrap" in path:
+            return "imports"
+        if f"{os.sep}streamlit{os.sep}" in path:
+            return "streamlit"
+    return "app"
+
+def _flow(stack):
+    # The outermost two functions in the role modules: the flow and the tab it rendered.
+    names = [code.co_name for code in stack if os.path.basename(code.co_filename) in FLOW_MODULES]
+    return "/".join(names[:2]) or "(outside flows)"
+
+@contextmanager
+def profile_rerun(name):
+    # Nested calls (a tab inside a profiled page run) join the outer profile.
+    if _active.get() is not None or not profiling_requested():
+        yield
+        return
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError as e:
+        # Another profiler (a debugger, coverage) already owns this thread.
+        print(f"Error starting profiler: {str(e)}")
+        profile = None
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    token = _active.set(sampler)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        seconds = time.monotonic() - started
+        _active.reset(token)
+        if profile is not None:
+            profile.disable()
+        sampler.stop()
+        try:
+            _save(name, seconds, profile, sampler)
+        except Exception as e:
+            print(f"Error saving profile for {name}: {str(e)}")
+
+def slow_threshold():
+    # Seconds at or above which a profiled rerun is kept as an outlier; None until enough reruns.
+    with _durations_lock:
+        durations = sorted(_durations)
+    if len(durations) < PROFILE_MIN_RERUNS:
+        return None
+    return durations[min(len(durations) - 1, math.ceil(len(durations) * PROFILE_KEEP_PERCENTILE / 100) - 1)]
+
+def _save(name, seconds, profile, sampler):
+    metrics.observe('profiled_rerun_seconds', seconds, page=name)
+    threshold = slow_threshold()
+    with _durations_lock:
+        _durations.append(seconds)
+    slow = threshold is not None and seconds >= threshold
+    directory = os.path.join(PROFILE_DIR, "slow" if slow else "recent")
+    stem = os.path.join(directory, f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{name}-{seconds * 1000:.0f}ms")
+
+    samples = sum(sampler.stacks.values())
+    per_sample = seconds / samples if samples else 0.0
+    categories = Counter()
+    flows = Counter()
+    for stack, count in sampler.stacks.items():
+        categories[_category(stack)] += count
+        flows[_flow(stack)] += count
+    summary = {
+        'page': name,
+        'seconds': seconds,
+        'slow_threshold_seconds': threshold,
+        'samples': samples,
+        'categories': {category: count * per_sample for category, count in categories.most_common()},
+        'flows': {flow: count * per_sample for flow, count in flows.most_common()},
+    }
+    if profile is not None:
+        stats = pstats.Stats(profile).stats
+        top = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)[:20]
+        summary['top_functions'] = [{'function': f"{os.path.basename(filename)}:{line}:{function}", 'calls': calls,
+                                     'self_seconds': own, 'total_seconds': total}
+                                    for (filename, line, function), (_, calls, own, total, _) in top]
+
+    with _files_lock:
+        os.makedirs(directory, exist_ok=True)
+        # Collapsed stacks, one "frame;frame;frame count" line each: flamegraph.pl and speedscope read these.
+        with open(f"{stem}.folded", "w") as f:
+            for stack, count in sampler.stacks.most_common():
+                f.write(";".join(_frame_name(code) for code in stack) + f" {count}\n")
+        if profile is not None:
+            profile.dump_stats(f"{stem}.prof")
+        with open(f"{stem}.json", "w") as f:
+            json.dump(summary, f, indent=2)
+        _prune(directory, PROFILE_KEEP_SLOW if slow else PROFILE_KEEP_RECENT)
+    if slow:
+        print(f"Slow rerun of {name} ({seconds:.2f}s, threshold {threshold:.2f}s) profiled to {stem}.*")
+
+def _prune(directory, keep):
+    # File names start with a timestamp, so sorting them orders the reruns.
+    stems = sorted({entry.rsplit(".", 1)[0] for entry in os.listdir(directory)})
+    for stem in stems[:-keep]:
+        for extension in (".folded", ".prof", ".json"):
+            path = os.path.join(directory, stem + extension)
+            if os.path.exists(path):
+                os.remove(path)
+
+def retained_profiles(kind="slow"):
+    # Summaries of the kept reruns, newest first.
+    directory = os.path.join(PROFILE_DIR, kind)
+    if not os.path.isdir(directory):
+        return []
+    with _files_lock:
+        names = sorted((entry for entry in os.listdir(directory) if entry.endswith(".json")), reverse=True)
+        profiles = []
+        for entry in names:
+            try:
+                with open(os.path.join(directory, entry)) as f:
+                    profiles.append({**json.load(f), 'path': os.path.join(directory, entry[:-len(".json")])})
+            except (OSError, ValueError) as e:
+                print(f"Error reading profile {entry}: {str(e)}")
+        return profiles
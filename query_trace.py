@@ -0,0 +1,167 @@
+import contextvars
+import json
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+import metrics
+
+# The same query shape (table, operation, filter columns) this many times in one rerun is
+# reported as an N+1 suspect.
+N_PLUS_ONE_THRESHOLD = 3
+RECENT_RERUNS = 200
+QUERIES_PER_RERUN_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+RESPONSE_BYTES_BUCKETS = (1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+# Response sizes are estimated from this many rows rather than serialising the whole result.
+SIZE_SAMPLE_ROWS = 20
+
+_current = contextvars.ContextVar('query_trace', default=None)
+_recent = deque(maxlen=RECENT_RERUNS)
+_recent_lock = threading.Lock()
+
+class RerunTrace:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.monotonic()
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def record(self, query):
+        with self.lock:
+            self.queries.append(query)
+
+    def suspects(self):
+        with self.lock:
+            shapes = Counter(query['shape'] for query in self.queries)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= N_PLUS_ONE_THRESHOLD]
+
+@contextmanager
+def rerun_trace(name):
+    # Collects every query issued while rendering; nested calls join the outer trace.
+    # parallel.submit copies the context, so queries run on the shared pool are included.
+    trace = _current.get()
+    if trace is not None:
+        yield trace
+        return
+    trace = RerunTrace(name)
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+        _finish(trace)
+
+def _finish(trace):
+    suspects = trace.suspects()
+    with trace.lock:
+        queries = list(trace.queries)
+    metrics.observe('db_queries_per_rerun', len(queries), buckets=QUERIES_PER_RERUN_BUCKETS, page=trace.name)
+    for shape, count in suspects:
+        metrics.increment('db_n_plus_one_suspects_total', table=shape[0], page=trace.name)
+        print(f"Possible N+1 in {trace.name}: {count} x {describe_shape(shape)}")
+    with _recent_lock:
+        _recent.append({
+            'page': trace.name,
+            'finished_at': time.time(),
+            'seconds': time.monotonic() - trace.started,
+            'queries': len(queries),
+            'query_seconds': sum(query['seconds'] for query in queries),
+            'rows': sum(query['rows'] for query in queries),
+            'bytes': sum(query['bytes'] for query in queries),
+            'n_plus_one': [(describe_shape(shape), count) for shape, count in suspects],
+            'detail': queries,
+        })
+
+def recent_reruns():
+    with _recent_lock:
+        return list(_recent)
+
+def estimate_size(data):
+    # Approximate JSON size: a sample of the rows, scaled up to the full row count.
+    if data is None:
+        return 0
+    if not isinstance(data, list) or len(data) <= SIZE_SAMPLE_ROWS:
+        return len(json.dumps(data, default=str))
+    step = len(data) / SIZE_SAMPLE_ROWS
+    sample = [data[int(i * step)] for i in range(SIZE_SAMPLE_ROWS)]
+    return len(json.dumps(sample, default=str)) * len(data) // SIZE_SAMPLE_ROWS
+
+def describe_shape(shape):
+    table, operation, filters = shape
+    return f"{operation} {table}" + (f" [{', '.join(filters)}]" if filters else "")
+
+class TracedClient:
+    # Drop-in wrapper around the Supabase client: table() and rpc() queries are timed and
+    # recorded; everything else (auth, storage, ...) passes straight through.
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        return TracedQuery(self._client.table(name), name, ())
+
+    def from_(self, name):
+        return self.table(name)
+
+    def rpc(self, fn, params=None, *args, **kwargs):
+        shape_filters = tuple(sorted(params or {}))
+        return TracedQuery(self._client.rpc(fn, params or {}, *args, **kwargs), f"rpc:{fn}", (("rpc", None),) + tuple(("param", key) for key in shape_filters))
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+class TracedQuery:
+    def __init__(self, builder, table, calls):
+        self._builder = builder
+        self._table = table
+        self._calls = calls
+
+    def __getattr__(self, name):
+        attribute = getattr(self._builder, name)
+        if not callable(attribute):
+            # Properties such as not_ return the builder for the next call.
+            return TracedQuery(attribute, self._table, self._calls + ((name, None),)) if hasattr(attribute, 'execute') else attribute
+
+        def call(*args, **kwargs):
+            result = attribute(*args, **kwargs)
+            if not hasattr(result, 'execute'):
+                return result
+            column = args[0] if args and isinstance(args[0], str) else None
+            return TracedQuery(result, self._table, self._calls + ((name, column),))
+        return call
+
+    def execute(self):
+        operation = next((method for method, _ in self._calls if method in ('select', 'insert', 'update', 'upsert', 'delete', 'rpc')), 'select')
+        # Values are left out so the same query for different ids has the same shape.
+        filters = tuple(f"{method}({column})" if column else method for method, column in self._calls
+                        if method not in ('select', 'insert', 'update', 'upsert', 'delete', 'rpc'))
+        started = time.monotonic()
+        error = None
+        response = None
+        try:
+            response = self._builder.execute()
+            return response
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            seconds = time.monotonic() - started
+            data = getattr(response, 'data', None)
+            rows = len(data) if isinstance(data, list) else int(data is not None)
+            size = estimate_size(data)
+            labels = {'table': self._table, 'operation': operation}
+            metrics.observe('db_query_seconds', seconds, **labels)
+            metrics.increment('db_queries_total', **labels, outcome="error" if error else "ok")
+            metrics.increment('db_rows_total', rows, **labels)
+            metrics.observe('db_response_bytes', size, buckets=RESPONSE_BYTES_BUCKETS, **labels)
+            trace = _current.get()
+            if trace is not None:
+                trace.record({
+                    'table': self._table,
+                    'operation': operation,
+                    'filters': ", ".join(filters),
+                    'shape': (self._table, operation, filters),
+                    'seconds': seconds,
+                    'rows': rows,
+                    'bytes': size,
+                    'error': error,
+                })
@@ -0,0 +1,69 @@
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+# Pairs of active appointments sharing a professional or patient with overlapping slots; the
+# later booking comes first. Runs before migration 0009 has been applied, when every
+# appointment lasts the 60 minutes that migration gives existing rows.
+OVERLAPS_SQL = """
+    select later.id, earlier.id, later.professional_id, later.patient_id, later.appointment_date, later.appointment_time
+    from appointments later
+    join appointments earlier
+      on earlier.id <> later.id
+     and (earlier.professional_id = later.professional_id or earlier.patient_id = later.patient_id)
+     and tsrange(earlier.appointment_date + earlier.appointment_time,
+                 earlier.appointment_date + earlier.appointment_time + interval '60 minutes')
+      && tsrange(later.appointment_date + later.appointment_time,
+                 later.appointment_date + later.appointment_time + interval '60 minutes')
+     and (earlier.created_at, earlier.id) < (later.created_at, later.id)
+    where later.status <> 'cancelled' and earlier.status <> 'cancelled'
+    order by later.created_at, later.id
+"""
+
+def find_overlaps(conn):
+    return conn.execute(OVERLAPS_SQL).fetchall()
+
+def cancel_later_bookings(conn):
+    # Cancels, in booking order, each appointment that overlaps an earlier active one and records
+    # it so the clinic can contact the patient. Returns the (cancelled, conflicting) id pairs.
+    conn.execute(
+        "create table if not exists appointment_overlaps_cancelled ("
+        "appointment_id bigint primary key references appointments (id) on delete cascade, "
+        "conflicting_appointment_id bigint not null references appointments (id) on delete cascade, "
+        "cancelled_at timestamptz not null default now())"
+    )
+    cancelled = []
+    while True:
+        overlap = conn.execute(OVERLAPS_SQL + " limit 1").fetchone()
+        if overlap is None:
+            return cancelled
+        appointment_id, conflicting_id = overlap[0], overlap[1]
+        conn.execute("update appointments set status = 'cancelled' where id = %s", (appointment_id,))
+        conn.execute(
+            "insert into appointment_overlaps_cancelled (appointment_id, conflicting_appointment_id) values (%s, %s)",
+            (appointment_id, conflicting_id),
+        )
+        cancelled.append((appointment_id, conflicting_id))
+
+if __name__ == "__main__":
+    if not DATABASE_URL:
+        print("Error: DATABASE_URL must be set")
+        sys.exit(1)
+
+    import psycopg
+
+    # Lists overlapping bookings; with --cancel, cancels the later booking of each pair.
+    with psycopg.connect(DATABASE_URL) as conn:
+        if "--cancel" in sys.argv:
+            for appointment_id, conflicting_id in cancel_later_bookings(conn):
+                print(f"Cancelled appointment {appointment_id} overlapping appointment {conflicting_id}")
+        else:
+            overlaps = find_overlaps(conn)
+            for appointment_id, conflicting_id, professional_id, patient_id, date, time in overlaps:
+                print(f"Appointment {appointment_id} ({date} {time}, professional {professional_id}, "
+                      f"patient {patient_id}) overlaps appointment {conflicting_id}")
+            print(f"{len(overlaps)} overlapping pair(s). Rerun with --cancel to cancel the later booking of each.")
@@ -0,0 +1,75 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from database import supabase_client
+from parallel import gather
+
+ACTIVITY_STATUSES = ["pending", "in_progress", "completed"]
+SIGNUP_PAGE_SIZE = 1000
+
+def count_rows(table, **filters):
+    # Exact server-side count; head=True means no rows travel over the wire.
+    query = supabase_client.table(table).select('id', count='exact', head=True)
+    for column, value in filters.items():
+        query = query.eq(column, value)
+    return query.execute().count or 0
+
+def get_admin_statistics(signup_days=30):
+    try:
+        response = supabase_client.rpc('admin_statistics', {'signup_days': signup_days}).execute()
+        if response.data:
+            return response.data
+    except Exception as e:
+        print(f"Error fetching admin statistics, falling back to count queries: {str(e)}")
+    return _count_statistics(signup_days)
+
+def _count_statistics(signup_days=30):
+    # Used when the admin_statistics function (migrations/0003_admin_statistics.sql) is not installed.
+    try:
+        counts = gather(
+            total_users=lambda: count_rows('users'),
+            patient=lambda: count_rows('users', user_type='patient'),
+            professional=lambda: count_rows('users', user_type='professional'),
+            admin=lambda: count_rows('users', user_type='admin'),
+            total_reports=lambda: count_rows('reports'),
+            total_appointments=lambda: count_rows('appointments'),
+            activity_distribution=get_activity_distribution,
+            daily_signups=lambda: get_daily_signups(signup_days),
+        )
+        return {
+            'total_users': counts['total_users'],
+            'users_by_type': {user_type: counts[user_type] for user_type in ["patient", "professional", "admin"]},
+            'total_reports': counts['total_reports'],
+            'total_appointments': counts['total_appointments'],
+            'daily_signups': counts['daily_signups'],
+            'activity_distribution': counts['activity_distribution'],
+        }
+    except Exception as e:
+        print(f"Error counting admin statistics: {str(e)}")
+        return {}
+
+def get_daily_signups(signup_days):
+    # Only created_at of recent signups is fetched, a page at a time; None if it can't be loaded.
+    since = (datetime.now(timezone.utc) - timedelta(days=signup_days)).isoformat()
+    days = Counter()
+    try:
+        offset = 0
+        while True:
+            page = (
+                supabase_client.table('users')
+                .select('created_at')
+                .gte('created_at', since)
+                .order('created_at')
+                .range(offset, offset + SIGNUP_PAGE_SIZE - 1)
+                .execute()
+                .data
+            )
+            days.update(row['created_at'][:10] for row in page)
+            if len(page) < SIGNUP_PAGE_SIZE:
+                return dict(sorted(days.items()))
+            offset += SIGNUP_PAGE_SIZE
+    except Exception as e:
+        print(f"Error counting daily signups: {str(e)}")
+        return None
+
+def get_activity_distribution():
+    return {status: count_rows('activities', status=status) for status in ACTIVITY_STATUSES}
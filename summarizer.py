@@ -0,0 +1,136 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import supabase_client
+from ai_listener import generate_summary, merge_summaries
+from parallel import submit
+
+# Fold new turns into the running summary every few turns; each fold sends
+# at most the previous summary plus FOLD_EVERY_TURNS..MAX_TURNS_PER_FOLD turns.
+FOLD_EVERY_TURNS = 6
+MAX_TURNS_PER_FOLD = 20
+# A conversation with unsummarised turns and no activity for this long is treated as ended.
+SESSION_IDLE_SECONDS = 15 * 60
+SWEEP_INTERVAL_SECONDS = 60
+
+# Backfill chunks get their own small pool: folds already run on the shared pool, and waiting
+# there for tasks queued on the same pool can starve it.
+_chunk_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="summary-chunks")
+_open_conversations = {}
+_open_lock = threading.Lock()
+_sweeper = None
+
+class ConversationSummary:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.summary = ""
+        self.folded_turns = 0
+        self.report_id = None
+        self.pending = []
+        self.running = False
+        self.flush_requested = False
+        self.last_active = time.monotonic()
+        self.last_error = None
+        self.lock = threading.Lock()
+
+def get_conversation_summary(session_state, user_id):
+    state = session_state.get('conversation_summary')
+    if state is None or state.user_id != user_id:
+        state = session_state['conversation_summary'] = ConversationSummary(user_id)
+    return state
+
+def record_turns(state, turns, flush=False):
+    # flush=True folds whatever is pending, however few turns; a fold already running picks it up.
+    with state.lock:
+        state.pending.extend(turns)
+        state.last_active = time.monotonic()
+        state.flush_requested = state.flush_requested or flush
+        start = not state.running and state.pending and (len(state.pending) >= FOLD_EVERY_TURNS or state.flush_requested)
+        if start:
+            state.running = True
+    if turns:
+        _track(state)
+    return submit(_fold_pending, state) if start else None
+
+def fold_evicted(state, included_turns):
+    # Unsummarised turns that no longer fit in the reply context are folded now, not at the next
+    # FOLD_EVERY_TURNS boundary, so the next request's summary covers them.
+    with state.lock:
+        evicted = len(state.pending) > included_turns
+    return record_turns(state, [], flush=True) if evicted else None
+
+def end_conversation(session_state):
+    # Called when the session ends (logout); idle conversations are flushed by the sweeper.
+    state = session_state.get('conversation_summary')
+    if state is not None:
+        with _open_lock:
+            _open_conversations.pop(id(state), None)
+        return record_turns(state, [], flush=True)
+    return None
+
+def _track(state):
+    global _sweeper
+    with _open_lock:
+        _open_conversations[id(state)] = state
+        if _sweeper is None:
+            _sweeper = threading.Thread(target=_sweep, name="summary-sweeper", daemon=True)
+            _sweeper.start()
+
+def _sweep():
+    while True:
+        time.sleep(SWEEP_INTERVAL_SECONDS)
+        now = time.monotonic()
+        with _open_lock:
+            idle = [state for state in _open_conversations.values() if now - state.last_active > SESSION_IDLE_SECONDS]
+            for state in idle:
+                del _open_conversations[id(state)]
+        for state in idle:
+            record_turns(state, [], flush=True)
+
+def _fold_pending(state):
+    try:
+        while True:
+            with state.lock:
+                if not state.pending or (len(state.pending) < FOLD_EVERY_TURNS and not state.flush_requested):
+                    if not state.pending:
+                        state.flush_requested = False
+                    state.running = False
+                    return state.summary
+                turns = list(state.pending)
+            summary = fold_turns(state.summary, turns)
+            with state.lock:
+                state.summary = summary
+                state.folded_turns += len(turns)
+                del state.pending[:len(turns)]
+            save_report(state)
+    except Exception as e:
+        with state.lock:
+            state.last_error = str(e)
+            state.running = False
+        print(f"Error updating conversation summary: {str(e)}")
+
+def fold_turns(previous_summary, turns):
+    if len(turns) <= MAX_TURNS_PER_FOLD:
+        return generate_summary(turns, previous_summary)
+    # Backfill: summarise fixed-size chunks concurrently, then reduce them with the previous summary.
+    chunks = [turns[i:i + MAX_TURNS_PER_FOLD] for i in range(0, len(turns), MAX_TURNS_PER_FOLD)]
+    summaries = list(_chunk_executor.map(generate_summary, chunks))
+    if previous_summary:
+        summaries.insert(0, previous_summary)
+    return merge_summaries(summaries)
+
+def save_report(state):
+    if state.report_id is None:
+        report = supabase_client.table('reports').insert({
+            'user_id': state.user_id,
+            'summary': state.summary,
+            'status': 'unreviewed',
+            'created_at': datetime.now().isoformat()
+        }).execute()
+        state.report_id = report.data[0]['id']
+    else:
+        supabase_client.table('reports').update({
+            'summary': state.summary,
+            'updated_at': datetime.now().isoformat()
+        }).eq('id', state.report_id).execute()
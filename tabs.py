@@ -0,0 +1,33 @@
+import functools
+import streamlit as st
+from query_trace import rerun_trace
+from profiler import profile_rerun
+
+def render_tabs(key, tabs):
+    # st.tabs runs every tab body on every rerun. Here only the selected tab runs, and tab bodies
+    # are fragments, so an interaction inside one reruns just that tab.
+    selected = st.radio("Section", list(tabs), horizontal=True, key=f"{key}_tab", label_visibility="collapsed")
+    tabs[selected]()
+
+def tab_fragment(render):
+    # A tab body as a fragment; when it reruns on its own, its queries are traced (and, when
+    # profiling is on, the run profiled) as a rerun of that tab.
+    @st.fragment
+    @functools.wraps(render)
+    def fragment(*args, **kwargs):
+        with rerun_trace(render.__name__), profile_rerun(render.__name__):
+            return render(*args, **kwargs)
+    return fragment
+
+def tab_cache(tab, name, loader):
+    # Data a tab loads the first time it is opened, kept for the session until cleared.
+    cache = st.session_state.setdefault('tab_cache', {})
+    key = (st.session_state.user['id'], tab, name)
+    if key not in cache:
+        cache[key] = loader()
+    return cache[key]
+
+def clear_tab_cache(tab, name=None):
+    cache = st.session_state.get('tab_cache', {})
+    for key in [key for key in cache if key[1] == tab and (name is None or key[2] == name)]:
+        del cache[key]
@@ -0,0 +1,94 @@
+import threading
+from change_feed import EventBus, LiveQuery
+
+def _change(type, record=None, old_record=None):
+    return {'table': 'reports', 'type': type, 'record': record or {}, 'old_record': old_record or {}}
+
+class CountingLoader:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return [dict(row) for row in self.rows]
+
+def _connected_bus():
+    bus = EventBus()
+    bus.set_connected(True)
+    return bus
+
+def test_changes_patch_loaded_rows():
+    bus = _connected_bus()
+    loader = CountingLoader([{'id': 1, 'status': 'open'}, {'id': 2, 'status': 'open'}])
+    query = LiveQuery(bus, 'reports', loader, lambda record: record.get('status') == 'open')
+    query.rows()
+
+    bus.publish(_change('INSERT', {'id': 3, 'status': 'open'}))
+    bus.publish(_change('UPDATE', {'id': 1, 'status': 'closed'}))
+    bus.publish(_change('DELETE', old_record={'id': 2}))
+
+    assert query.rows() == [{'id': 3, 'status': 'open'}]
+    assert loader.calls == 1
+    assert query.version == 3
+
+def test_version_ignores_rows_outside_the_query():
+    bus = _connected_bus()
+    query = LiveQuery(bus, 'reports', CountingLoader([{'id': 1, 'user_id': 'a'}]), lambda record: record.get('user_id') == 'a')
+    query.rows()
+
+    bus.publish(_change('INSERT', {'id': 2, 'user_id': 'b'}))
+    bus.publish(_change('DELETE', old_record={'id': 3}))
+    bus.publish(_change('UPDATE', {'id': 1, 'user_id': 'a'}))
+    assert query.version == 0
+
+    bus.publish(_change('UPDATE', {'id': 1, 'user_id': 'b'}))
+    assert query.version == 1
+
+def test_change_during_load_is_kept():
+    bus = _connected_bus()
+    loading, publish_done = threading.Event(), threading.Event()
+
+    def slow_loader():
+        loading.set()
+        publish_done.wait(5)
+        return [{'id': 1, 'status': 'open'}]
+
+    def publish_while_loading():
+        loading.wait(5)
+        bus.publish(_change('INSERT', {'id': 2}))
+        publish_done.set()
+
+    query = LiveQuery(bus, 'reports', slow_loader, lambda record: True)
+    publisher = threading.Thread(target=publish_while_loading)
+    publisher.start()
+    rows = query.rows()
+    publisher.join()
+
+    assert sorted(row['id'] for row in rows) == [1, 2]
+
+def test_reconnect_reloads():
+    bus = _connected_bus()
+    loader = CountingLoader([{'id': 1}])
+    query = LiveQuery(bus, 'reports', loader, lambda record: True)
+    query.rows()
+    epoch = bus.epoch
+
+    # A change made while the feed was down is never delivered; the reload picks it up.
+    bus.set_connected(False)
+    loader.rows.append({'id': 2})
+    bus.set_connected(True)
+
+    assert sorted(row['id'] for row in query.rows()) == [1, 2]
+    assert loader.calls == 2
+    assert bus.epoch != epoch
+    assert query.version == 1
+
+def test_without_feed_every_read_reloads():
+    bus = EventBus()
+    loader = CountingLoader([{'id': 1}])
+    query = LiveQuery(bus, 'reports', loader, lambda record: True)
+    query.rows()
+    query.rows()
+
+    assert loader.calls == 2
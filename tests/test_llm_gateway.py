@@ -0,0 +1,61 @@
+import threading
+import openai
+import pytest
+from fake_openai import FakeOpenAI
+from llm_gateway import LLMGateway, LLMRateLimited
+
+MESSAGES = [{"role": "user", "content": "I had a rough day."}]
+
+@pytest.fixture
+def fake():
+    server = FakeOpenAI(retry_after=0).start()
+    yield server
+    server.stop()
+
+def _gateway(fake, **kwargs):
+    client = openai.OpenAI(api_key="fake", base_url=fake.base_url, max_retries=0)
+    return LLMGateway(client_factory=lambda: client, **kwargs)
+
+def test_retries_rate_limited_requests(fake):
+    fake.fail_first = 2
+
+    assert _gateway(fake).chat("gpt-4o-mini", MESSAGES) == fake.reply
+    assert len(fake.requests) == 3
+
+def test_client_errors_are_not_retried(fake):
+    fake.fail_first, fake.fail_status = 1, 400
+
+    with pytest.raises(openai.BadRequestError):
+        _gateway(fake).chat("gpt-4o-mini", MESSAGES)
+    assert len(fake.requests) == 1
+
+def test_identical_requests_share_one_call(fake):
+    fake.latency = 0.3
+    gateway = _gateway(fake)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(gateway.chat("gpt-4o-mini", MESSAGES))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [fake.reply] * 4
+    assert len(fake.requests) == 1
+
+def test_user_over_rate_is_rejected(fake):
+    gateway = _gateway(fake, user_rate=0.01, user_burst=1)
+    gateway.chat("gpt-4o-mini", MESSAGES, user_id="patient-1")
+
+    with pytest.raises(LLMRateLimited):
+        gateway.chat("gpt-4o-mini", [{"role": "user", "content": "Still here."}], user_id="patient-1", deadline=1)
+    # Other users have their own bucket.
+    assert gateway.chat("gpt-4o-mini", MESSAGES, user_id="patient-2") == fake.reply
+    assert len(fake.requests) == 2
+
+def test_stream_retries_opening(fake):
+    fake.fail_first = 1
+    timings = {}
+
+    assert "".join(_gateway(fake).stream_chat("gpt-4o-mini", MESSAGES, timings=timings)) == fake.reply
+    assert len(fake.requests) == 2
+    assert 'time_to_first_token' in timings
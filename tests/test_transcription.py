@@ -0,0 +1,52 @@
+import threading
+import numpy as np
+from transcription import StreamingTranscription, StubTranscriber
+
+SAMPLE_RATE = 16000
+
+def _speech(seconds):
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    return (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16)
+
+def _silence(seconds):
+    return np.zeros(int(SAMPLE_RATE * seconds), dtype=np.int16)
+
+class BlockingTranscriber(StubTranscriber):
+    # Holds back segments whose transcript starts with the given prefix until released.
+    def __init__(self, block_prefix):
+        super().__init__()
+        self.block_prefix = block_prefix
+        self.release = threading.Event()
+
+    def transcribe(self, wav_bytes):
+        text = super().transcribe(wav_bytes)
+        if text.startswith(self.block_prefix):
+            self.release.wait(5)
+        return text
+
+def test_segments_transcribed_in_utterance_order():
+    stream = StreamingTranscription(StubTranscriber(["I slept badly.", "Work was hard."]), SAMPLE_RATE)
+    stream.feed(np.concatenate([_speech(1), _silence(1), _speech(1), _silence(1)]))
+
+    assert stream.finish(timeout=5) == "I slept badly. Work was hard."
+    assert stream.pending() == 0
+    assert stream.failed() == 0
+
+def test_stub_reports_duration_without_canned_responses():
+    stream = StreamingTranscription(StubTranscriber(), SAMPLE_RATE)
+    stream.feed(np.concatenate([_speech(1), _silence(1)]))
+
+    assert stream.finish(timeout=5).startswith("[1.")
+
+def test_finish_returns_partial_text_after_timeout():
+    transcriber = BlockingTranscriber("[1.")
+    stream = StreamingTranscription(transcriber, SAMPLE_RATE)
+    stream.feed(np.concatenate([_speech(1), _silence(1), _speech(2), _silence(1)]))
+    try:
+        text = stream.finish(timeout=0.5)
+        assert stream.pending() == 1
+        # The later segment is kept even though the earlier one is still in flight.
+        assert text.startswith("[2.")
+        assert stream.text() == ""
+    finally:
+        transcriber.release.set()
@@ -0,0 +1,51 @@
+import upload_queue
+from upload_queue import LocalStorage, UploadError, UploadQueue
+
+class FlakyStorage(LocalStorage):
+    # Fails the given chunk writes once each, after part of the upload has landed.
+    def __init__(self, root, fail_writes, retryable=True):
+        super().__init__(root)
+        self.fail_writes = set(fail_writes)
+        self.retryable = retryable
+        self.writes = 0
+
+    def write(self, upload_id, offset, chunk):
+        self.writes += 1
+        if self.writes in self.fail_writes:
+            raise UploadError("Injected failure", retryable=self.retryable)
+        return super().write(upload_id, offset, chunk)
+
+def _no_backoff(monkeypatch):
+    monkeypatch.setattr(upload_queue, "UPLOAD_BACKOFF_SECONDS", 0.0)
+
+def test_upload_writes_every_chunk(tmp_path):
+    uploads = UploadQueue(LocalStorage(tmp_path), concurrency=1, chunk_size=4)
+    job = uploads.enqueue("patient/a.wav", b"0123456789", "audio/wav")
+
+    assert job.done.wait(5)
+    assert job.status == "done"
+    assert (tmp_path / "patient/a.wav").read_bytes() == b"0123456789"
+    assert uploads.stats()["succeeded"] == 1
+
+def test_upload_resumes_from_stored_offset(tmp_path, monkeypatch):
+    _no_backoff(monkeypatch)
+    storage = FlakyStorage(tmp_path, fail_writes={2})
+    uploads = UploadQueue(storage, concurrency=1, chunk_size=4)
+    job = uploads.enqueue("patient/b.wav", b"0123456789", "audio/wav")
+
+    assert job.done.wait(5)
+    assert job.status == "done"
+    assert job.attempts == 2
+    assert (tmp_path / "patient/b.wav").read_bytes() == b"0123456789"
+    # Only the failed chunk and the rest were written again, not the first chunk.
+    assert storage.writes == 4
+
+def test_upload_stops_on_permanent_error(tmp_path, monkeypatch):
+    _no_backoff(monkeypatch)
+    uploads = UploadQueue(FlakyStorage(tmp_path, fail_writes={1}, retryable=False), concurrency=1, chunk_size=4)
+    job = uploads.enqueue("patient/c.wav", b"0123456789", "audio/wav")
+
+    assert job.done.wait(5)
+    assert job.status == "failed"
+    assert job.attempts == 1
+    assert uploads.stats()["failed"] == 1
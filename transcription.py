@@ -0,0 +1,175 @@
+import io
+import threading
+import wave
+from collections import deque
+from concurrent.futures import wait
+import numpy as np
+from parallel import submit
+
+# Energy-based voice activity detection tuned for conversational speech.
+VAD_WINDOW_MS = 30
+VAD_THRESHOLD_DBFS = -45.0
+VAD_MIN_SPEECH_MS = 150
+VAD_MAX_SILENCE_MS = 600
+VAD_PREROLL_MS = 300
+MAX_SEGMENT_SECONDS = 15
+
+def frame_to_mono_int16(frame):
+    # av.AudioFrame -> 1-D int16 samples; packed layouts interleave channels in a single row.
+    samples = frame.to_ndarray()
+    channels = len(frame.layout.channels)
+    if frame.format.is_planar:
+        mono = samples.astype(np.float32).mean(axis=0)
+    else:
+        mono = samples.reshape(-1, channels).astype(np.float32).mean(axis=1)
+    if frame.format.name.startswith('flt'):
+        mono = mono * 32767
+    return np.clip(mono, -32768, 32767).astype(np.int16)
+
+def encode_wav(samples, sample_rate):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(np.asarray(samples, dtype=np.int16).tobytes())
+    return buffer.getvalue()
+
+class EnergyVAD:
+    def __init__(self, sample_rate, threshold_dbfs=VAD_THRESHOLD_DBFS):
+        self.sample_rate = sample_rate
+        self.threshold_dbfs = threshold_dbfs
+        self.window = int(sample_rate * VAD_WINDOW_MS / 1000)
+        self.min_speech_windows = max(1, VAD_MIN_SPEECH_MS // VAD_WINDOW_MS)
+        self.max_silence_windows = max(1, VAD_MAX_SILENCE_MS // VAD_WINDOW_MS)
+        self.max_segment_windows = MAX_SEGMENT_SECONDS * 1000 // VAD_WINDOW_MS
+        self._preroll = deque(maxlen=max(self.min_speech_windows, VAD_PREROLL_MS // VAD_WINDOW_MS))
+        self._remainder = np.zeros(0, dtype=np.int16)
+        self._segment = []
+        self._speech_run = 0
+        self._silence_run = 0
+
+    def is_speech(self, window):
+        rms = np.sqrt(np.mean(np.square(window.astype(np.float32))))
+        return 20 * np.log10(rms / 32768 + 1e-10) > self.threshold_dbfs
+
+    def process(self, samples):
+        samples = np.concatenate([self._remainder, samples])
+        usable = len(samples) // self.window * self.window
+        segments = []
+        for start in range(0, usable, self.window):
+            window = samples[start:start + self.window]
+            speech = self.is_speech(window)
+            if self._segment:
+                self._segment.append(window)
+                self._silence_run = 0 if speech else self._silence_run + 1
+                if self._silence_run >= self.max_silence_windows or len(self._segment) >= self.max_segment_windows:
+                    segments.append(self._close_segment())
+            else:
+                self._preroll.append(window)
+                self._speech_run = self._speech_run + 1 if speech else 0
+                if self._speech_run >= self.min_speech_windows:
+                    self._segment = list(self._preroll)
+                    self._preroll.clear()
+        self._remainder = samples[usable:]
+        return segments
+
+    def flush(self):
+        if self._segment:
+            return [self._close_segment()]
+        return []
+
+    def _close_segment(self):
+        # Drop the trailing silence that ended the utterance.
+        kept = self._segment[:len(self._segment) - self._silence_run] or self._segment
+        segment = np.concatenate(kept)
+        self._segment = []
+        self._speech_run = 0
+        self._silence_run = 0
+        return segment
+
+class WhisperTranscriber:
+    def __init__(self, gateway, model="whisper-1"):
+        self.gateway = gateway
+        self.model = model
+
+    def transcribe(self, wav_bytes):
+        return self.gateway.transcribe(
+            model=self.model,
+            file=("segment.wav", wav_bytes, "audio/wav"),
+            response_format="text"
+        ).strip()
+
+class StubTranscriber:
+    # Local stand-in: returns canned text (or a duration marker) for each segment.
+    def __init__(self, responses=None):
+        self.responses = deque(responses or [])
+        self.calls = 0
+
+    def transcribe(self, wav_bytes):
+        self.calls += 1
+        if self.responses:
+            return self.responses.popleft()
+        with wave.open(io.BytesIO(wav_bytes)) as wav_file:
+            return f"[{wav_file.getnframes() / wav_file.getframerate():.1f}s of speech]"
+
+class StreamingTranscription:
+    def __init__(self, transcriber, sample_rate=None):
+        self.transcriber = transcriber
+        self.sample_rate = sample_rate
+        self.vad = EnergyVAD(sample_rate) if sample_rate else None
+        self._futures = []
+        self._lock = threading.Lock()
+
+    def feed_frames(self, frames):
+        for frame in frames:
+            if self.vad is None:
+                self.sample_rate = frame.sample_rate
+                self.vad = EnergyVAD(frame.sample_rate)
+            self.feed(frame_to_mono_int16(frame))
+
+    def feed(self, samples):
+        for segment in self.vad.process(samples):
+            self._submit(segment)
+
+    def finish(self, timeout=None):
+        # Waits up to timeout seconds in total, then returns every segment transcribed by then;
+        # pending() tells the caller how many were still outstanding.
+        if self.vad is not None:
+            for segment in self.vad.flush():
+                self._submit(segment)
+        with self._lock:
+            futures = list(self._futures)
+        wait(futures, timeout=timeout)
+        return " ".join(self.partial_transcripts(skip_pending=True))
+
+    def _submit(self, segment):
+        wav_bytes = encode_wav(segment, self.sample_rate)
+        with self._lock:
+            self._futures.append(submit(self.transcriber.transcribe, wav_bytes))
+
+    def partial_transcripts(self, skip_pending=False):
+        # Completed segments in utterance order, stopping at the first one still in flight
+        # unless skip_pending is set.
+        transcripts = []
+        with self._lock:
+            futures = list(self._futures)
+        for future in futures:
+            if not future.done():
+                if skip_pending:
+                    continue
+                break
+            if future.exception() is None and future.result():
+                transcripts.append(future.result())
+        return transcripts
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for future in self._futures if not future.done())
+
+    def failed(self):
+        with self._lock:
+            return sum(1 for future in self._futures if future.done() and future.exception() is not None)
+
+    def text(self):
+        return " ".join(self.partial_transcripts())
@@ -0,0 +1,193 @@
+import base64
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from pathlib import Path
+import requests
+import metrics
+
+UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024  # Supabase's resumable endpoint requires 6 MB chunks
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "2"))
+UPLOAD_QUEUE_SIZE = int(os.environ.get("UPLOAD_QUEUE_SIZE", "32"))
+UPLOAD_MAX_ATTEMPTS = 5
+UPLOAD_BACKOFF_SECONDS = 0.5
+UPLOAD_BACKOFF_CAP_SECONDS = 30.0
+
+class UploadError(Exception):
+    def __init__(self, message, retryable=True):
+        super().__init__(message)
+        self.retryable = retryable
+
+class SupabaseResumableStorage:
+    # Minimal TUS client for Supabase Storage's /upload/resumable endpoint.
+    def __init__(self, url, key, bucket, timeout=30):
+        self.endpoint = f"{url.rstrip('/')}/storage/v1/upload/resumable"
+        self.bucket = bucket
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {key}", "apikey": key, "Tus-Resumable": "1.0.0"})
+
+    def create(self, path, size, content_type):
+        metadata = {"bucketName": self.bucket, "objectName": path, "contentType": content_type}
+        response = self._request("POST", self.endpoint, headers={
+            "Upload-Length": str(size),
+            "Upload-Metadata": ",".join(f"{k} {base64.b64encode(v.encode()).decode()}" for k, v in metadata.items()),
+        })
+        return response.headers["Location"]
+
+    def offset(self, upload_id):
+        return int(self._request("HEAD", upload_id).headers["Upload-Offset"])
+
+    def write(self, upload_id, offset, chunk):
+        response = self._request("PATCH", upload_id, data=chunk, headers={
+            "Upload-Offset": str(offset),
+            "Content-Type": "application/offset+octet-stream",
+        })
+        return int(response.headers["Upload-Offset"])
+
+    def _request(self, method, url, **kwargs):
+        try:
+            response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            raise UploadError(str(e))
+        if response.status_code >= 400:
+            retryable = response.status_code == 429 or response.status_code >= 500
+            raise UploadError(f"{method} {response.status_code}: {response.text[:200]}", retryable=retryable)
+        return response
+
+class LocalStorage:
+    # Filesystem stand-in with the same create/offset/write contract, for tests and offline runs.
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def create(self, path, size, content_type):
+        target = self.root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(b"")
+        return str(target)
+
+    def offset(self, upload_id):
+        return Path(upload_id).stat().st_size
+
+    def write(self, upload_id, offset, chunk):
+        with open(upload_id, "r+b") as f:
+            f.seek(offset)
+            f.write(chunk)
+            f.truncate()
+        return offset + len(chunk)
+
+class UploadJob:
+    def __init__(self, path, data, content_type):
+        self.id = str(uuid.uuid4())
+        self.path = path
+        self.data = data
+        self.content_type = content_type
+        self.size = len(data)
+        self.status = "queued"
+        self.bytes_sent = 0
+        self.attempts = 0
+        self.error = None
+        self.upload_id = None
+        self.done = threading.Event()
+
+class UploadQueue:
+    def __init__(self, storage, concurrency=UPLOAD_CONCURRENCY, max_pending=UPLOAD_QUEUE_SIZE,
+                 chunk_size=UPLOAD_CHUNK_SIZE, max_attempts=UPLOAD_MAX_ATTEMPTS):
+        self.storage = storage
+        self.chunk_size = chunk_size
+        self.max_attempts = max_attempts
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self.counters = {"enqueued": 0, "rejected": 0, "succeeded": 0, "failed": 0, "retries": 0, "bytes": 0}
+        self._workers = [
+            threading.Thread(target=self._run, name=f"upload-worker-{i}", daemon=True)
+            for i in range(concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def enqueue(self, path, data, content_type):
+        job = UploadJob(path, data, content_type)
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            job.status, job.error = "failed", "Upload queue is full"
+            job.done.set()
+            self._count("rejected")
+            metrics.increment('audio_uploads_total', outcome="rejected")
+            return job
+        self._count("enqueued")
+        return job
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "pending": self._queue.qsize()}
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            try:
+                self._upload(job)
+            finally:
+                job.data = None if job.status == "done" else job.data
+                job.done.set()
+                self._queue.task_done()
+
+    def _upload(self, job):
+        started = time.monotonic()
+        job.status = "uploading"
+        while True:
+            job.attempts += 1
+            try:
+                if job.upload_id is None:
+                    job.upload_id = self.storage.create(job.path, job.size, job.content_type)
+                else:
+                    # Resume from whatever the server already has.
+                    job.bytes_sent = self.storage.offset(job.upload_id)
+                while job.bytes_sent < job.size:
+                    chunk = job.data[job.bytes_sent:job.bytes_sent + self.chunk_size]
+                    sent = self.storage.write(job.upload_id, job.bytes_sent, chunk) - job.bytes_sent
+                    job.bytes_sent += sent
+                    self._count("bytes", sent)
+                    metrics.increment('audio_upload_bytes_total', sent)
+                job.status = "done"
+                self._count("succeeded")
+                metrics.increment('audio_uploads_total', outcome="succeeded")
+                metrics.observe('audio_upload_seconds', time.monotonic() - started)
+                return
+            except Exception as e:
+                job.error = str(e)
+                retryable = getattr(e, "retryable", True)
+                if not retryable or job.attempts >= self.max_attempts:
+                    job.status = "failed"
+                    self._count("failed")
+                    metrics.increment('audio_uploads_total', outcome="failed")
+                    print(f"Audio upload {job.path} failed after {job.attempts} attempts: {job.error}")
+                    return
+                self._count("retries")
+                metrics.increment('audio_upload_retries_total')
+                job.status = "retrying"
+                delay = min(UPLOAD_BACKOFF_CAP_SECONDS, UPLOAD_BACKOFF_SECONDS * 2 ** (job.attempts - 1))
+                time.sleep(random.uniform(0, delay))
+
+_upload_queue = None
+_upload_queue_lock = threading.Lock()
+
+def get_upload_queue():
+    global _upload_queue
+    with _upload_queue_lock:
+        if _upload_queue is None:
+            local_root = os.environ.get("AUDIO_UPLOAD_LOCAL_DIR")
+            if local_root:
+                storage = LocalStorage(local_root)
+            else:
+                storage = SupabaseResumableStorage(os.environ["SUPABASE_URL"], os.environ["SUPABASE_KEY"], "audio-recordings")
+            _upload_queue = UploadQueue(storage)
+        return _upload_queue
@@ -0,0 +1,75 @@
+import streamlit as st
+from database import supabase_client
+
+SEARCH_PAGE_SIZE = 20
+# Trigram indexes need 3 characters; shorter terms would scan every user.
+SEARCH_MIN_CHARS = 3
+SEARCH_CACHE_TTL_SECONDS = 30
+
+# Results are cached briefly so repeated or resubmitted terms don't hit the database again.
+# A failed search raises out of the cached function, so st.cache_data never stores it.
+@st.cache_data(ttl=SEARCH_CACHE_TTL_SECONDS, max_entries=512, show_spinner=False)
+def _search_users(term, user_type, caseload_of, page, page_size):
+    rows = supabase_client.rpc('search_users', {
+        'search': term,
+        'role': user_type,
+        'caseload_of': caseload_of,
+        'page_size': page_size + 1,
+        'page_offset': page * page_size
+    }).execute().data
+    return rows[:page_size], len(rows) > page_size
+
+def search_users(term, user_type=None, caseload_of=None, page=0, page_size=SEARCH_PAGE_SIZE):
+    # Returns (None, False) when the search failed, so callers can tell it apart from no matches.
+    try:
+        return _search_users(term, user_type, caseload_of, page, page_size)
+    except Exception as e:
+        print(f"Error searching users: {str(e)}")
+        return None, False
+
+def user_label(user):
+    if user.get('display_name'):
+        return f"{user['display_name']} <{user['email']}>"
+    return user['email']
+
+def _set_page(key, page):
+    st.session_state[f"{key}_page"] = page
+
+def patient_picker(key, professional_id=None, label="Select Patient"):
+    caseload_of = None
+    if professional_id:
+        scope = st.radio("Search in", ["My patients", "All patients"], horizontal=True, key=f"{key}_scope")
+        if scope == "My patients":
+            caseload_of = professional_id
+
+    term = st.text_input("Search patients by email or name", key=f"{key}_term").strip()
+    # A new term or scope starts again from the first page.
+    query = (term, caseload_of)
+    if st.session_state.get(f"{key}_query") != query:
+        st.session_state[f"{key}_query"] = query
+        _set_page(key, 0)
+    page = st.session_state.get(f"{key}_page", 0)
+
+    if caseload_of is None and len(term) < SEARCH_MIN_CHARS:
+        st.caption(f"Type at least {SEARCH_MIN_CHARS} characters to search all patients.")
+        return None
+
+    results, has_more = search_users(term, 'patient', caseload_of, page)
+    if results is None:
+        st.error("Patient search is unavailable right now. Please try again.")
+        return None
+    if not results:
+        st.info("No matching patients found.")
+        return None
+
+    patients = {patient['id']: patient for patient in results}
+    selected_id = st.selectbox(label, options=list(patients), format_func=lambda patient_id: user_label(patients[patient_id]),
+                               key=f"{key}_select")
+
+    if page > 0 or has_more:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        col1.button("Previous", key=f"{key}_prev", disabled=page == 0, on_click=_set_page, args=(key, page - 1))
+        col2.caption(f"Page {page + 1}")
+        col3.button("Next", key=f"{key}_next", disabled=not has_more, on_click=_set_page, args=(key, page + 1))
+
+    return patients[selected_id]
@@ -1,8 +1,14 @@
 from database import supabase_client
+from identity import resolve_emails
+from availability import get_availability
+from change_feed import live_query
 from datetime import datetime
 
 def schedule_appointment(patient_id, professional_id, date, time):
+    availability = get_availability()
     try:
+        if availability.find_conflict(patient_id, professional_id, datetime.combine(date, time)):
+            return False
         appointment_data = {
             'patient_id': patient_id,
             'professional_id': professional_id,
@@ -11,20 +17,25 @@ def schedule_appointment(patient_id, professional_id, date, time):
             'status': 'scheduled'
         }
         
-        supabase_client.table('appointments').insert(appointment_data).execute()
+        appointment = supabase_client.table('appointments').insert(appointment_data).execute()
+        availability.booked(appointment.data[0])
         return True
     except Exception as e:
+        # Most likely the exclusion constraint caught a booking made by another replica.
+        availability.invalidate('professional_id', professional_id)
+        availability.invalidate('patient_id', patient_id)
         print(f"Error scheduling appointment: {str(e)}")
         return False
 
 def get_patient_reports():
     try:
-        reports = supabase_client.table('reports').select('*').execute()
+        # Loaded once per process, then kept current from the realtime change feed
+        reports = live_query('reports', 'reports', lambda: supabase_client.table('reports').select('*').execute().data).rows()
+        reports.sort(key=lambda report: report['created_at'], reverse=True)
+        emails = resolve_emails(report['user_id'] for report in reports)
         enhanced_reports = []
-        for report in reports.data:
-            user = supabase_client.table('users').select('email').eq('id', report['user_id']).single().execute()
-            report['user_email'] = user.data['email']
-            enhanced_reports.append(report)
+        for report in reports:
+            enhanced_reports.append({**report, 'user_email': emails.get(report['user_id'], 'Unknown user')})
         return enhanced_reports
     except Exception as e:
         print(f"Error fetching patient reports: {str(e)}")
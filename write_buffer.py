@@ -0,0 +1,299 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from database import supabase_client
+import metrics
+
+WRITE_BUFFER_SPILL_PATH = os.environ.get("WRITE_BUFFER_SPILL_PATH", "write_buffer.jsonl")
+# Processes sharing a working directory each lock one numbered spill file next to the configured path.
+WRITE_BUFFER_MAX_SLOTS = 32
+FLUSH_MAX_ROWS = int(os.environ.get("WRITE_BUFFER_MAX_ROWS", "200"))
+FLUSH_INTERVAL_SECONDS = float(os.environ.get("WRITE_BUFFER_INTERVAL_SECONDS", "1.0"))
+# After a failed flush the next one waits twice as long, up to this.
+FLUSH_MAX_BACKOFF_SECONDS = 60.0
+# A write still failing after this many flushes goes to the dead-letter file.
+WRITE_MAX_ATTEMPTS = int(os.environ.get("WRITE_BUFFER_MAX_ATTEMPTS", "10"))
+WRITE_BUFFER_DEAD_LETTER_PATH = os.environ.get("WRITE_BUFFER_DEAD_LETTER_PATH", "write_buffer.dead.jsonl")
+# Buffered inserts carry a client-generated key (unique in the table) so replays are idempotent.
+INSERT_KEY = 'client_ref'
+
+class WriteBehindBuffer:
+    # Inserts are batched per table; updates are coalesced per (table, id), last write wins.
+    # Every operation is fsynced to the spill file before it is acknowledged.
+    def __init__(self, client, spill_path=WRITE_BUFFER_SPILL_PATH, max_rows=FLUSH_MAX_ROWS,
+                 interval=FLUSH_INTERVAL_SECONDS, dead_letter_path=WRITE_BUFFER_DEAD_LETTER_PATH):
+        self.client = client
+        self.spill_path = self._claim_spill(spill_path)
+        self.dead_letter_path = dead_letter_path
+        self.max_rows = max_rows
+        self.interval = interval
+        self._inserts = defaultdict(dict)
+        self._updates = {}
+        # Failed flushes so far, per pending operation and in a row for the whole buffer.
+        self._attempts = {}
+        self._failures = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._recover()
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def insert(self, table, row):
+        row = {**row, INSERT_KEY: row.get(INSERT_KEY) or str(uuid.uuid4())}
+        self._record({'op': 'insert', 'table': table, 'row': row})
+        return row
+
+    def update(self, table, row_id, values):
+        self._record({'op': 'update', 'table': table, 'id': row_id, 'values': values})
+
+    def pending_inserts(self, table, **match):
+        with self._condition:
+            return [dict(row) for row in self._inserts.get(table, {}).values()
+                    if all(row.get(column) == value for column, value in match.items())]
+
+    def overlay(self, table, rows):
+        with self._condition:
+            return [{**row, **self._updates.get((table, row.get('id')), {})} for row in rows]
+
+    def merge_pending(self, table, rows, limit=None, order_by='created_at', **match):
+        # Read-your-writes: stored rows with pending updates applied, plus pending inserts, newest first.
+        stored_refs = {row.get(INSERT_KEY) for row in rows}
+        pending = [row for row in self.pending_inserts(table, **match) if row[INSERT_KEY] not in stored_refs]
+        merged = self.overlay(table, rows)
+        if pending:
+            merged = sorted(pending + merged, key=lambda row: _timestamp(row.get(order_by)), reverse=True)
+        return merged[:limit] if limit else merged
+
+    def flush(self):
+        with self._flush_lock:
+            with self._condition:
+                if not self._size():
+                    return 0
+                inserts, updates = self._inserts, self._updates
+                self._inserts, self._updates = defaultdict(dict), {}
+                # Later operations go to a fresh spill file while this batch is written.
+                self._spill.close()
+                os.replace(self.spill_path, self._flushing_path)
+                self._spill = open(self.spill_path, "a", encoding="utf-8")
+                attempts = self._attempts
+                self._attempts = {}
+            count = sum(len(rows) for rows in inserts.values()) + len(updates)
+            failed, rejected = self._write(inserts, updates)
+            retry = []
+            for op, error in failed:
+                (rejected if attempts.get(_op_key(op), 0) + 1 >= WRITE_MAX_ATTEMPTS else retry).append((op, error))
+            failed = retry
+            self._dead_letter(rejected)
+            self._requeue(failed, attempts)
+            with self._condition:
+                self._failures = self._failures + 1 if failed else 0
+            if failed:
+                metrics.increment('write_buffer_flush_failures_total')
+            count -= len(failed) + len(rejected)
+            metrics.increment('write_buffer_flushed_rows_total', count)
+            os.remove(self._flushing_path)
+            return count
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        self.flush()
+
+    @property
+    def _flushing_path(self):
+        return self.spill_path + ".flushing"
+
+    def _record(self, op):
+        with self._condition:
+            self._log(op)
+            self._apply(op)
+            if self._size() >= self.max_rows and not self._failures:
+                self._condition.notify()
+        metrics.increment('write_buffer_ops_total', table=op['table'], op=op['op'])
+
+    def _log(self, op):
+        self._spill.write(json.dumps(op, default=str) + "\n")
+        self._spill.flush()
+        os.fsync(self._spill.fileno())
+
+    def _apply(self, op):
+        if op.get('attempts'):
+            self._attempts[_op_key(op)] = op['attempts']
+        if op['op'] == 'insert':
+            self._inserts[op['table']][op['row'][INSERT_KEY]] = op['row']
+        else:
+            key = (op['table'], op['id'])
+            self._updates[key] = {**self._updates.get(key, {}), **op['values']}
+
+    def _size(self):
+        return sum(len(rows) for rows in self._inserts.values()) + len(self._updates)
+
+    def _write(self, inserts, updates):
+        # Returns (failed, rejected): (op, error) pairs to retry and to give up on.
+        failed, rejected = [], []
+        for table, rows in inserts.items():
+            ops = [{'op': 'insert', 'table': table, 'row': row} for row in rows.values()]
+            self._send(ops, lambda ops, table=table: self.client.table(table).upsert(
+                [op['row'] for op in ops], on_conflict=INSERT_KEY, ignore_duplicates=True).execute(), failed, rejected)
+        # Rows receiving identical values (e.g. the same new status) share one UPDATE ... WHERE id IN (...).
+        grouped = defaultdict(list)
+        for (table, row_id), values in updates.items():
+            grouped[(table, json.dumps(values, sort_keys=True, default=str))].append(
+                {'op': 'update', 'table': table, 'id': row_id, 'values': values})
+        for (table, values), ops in grouped.items():
+            self._send(ops, lambda ops, table=table, values=values: self.client.table(table).update(
+                json.loads(values)).in_('id', [op['id'] for op in ops]).execute(), failed, rejected)
+        return failed, rejected
+
+    def _send(self, ops, execute, failed, rejected):
+        # A batch the database rejects is halved until the offending rows are isolated, so one bad
+        # row doesn't hold back the rest. A transient failure leaves the whole batch for the next flush.
+        try:
+            execute(ops)
+        except Exception as e:
+            if _retryable(e):
+                print(f"Error flushing {len(ops)} writes to {ops[0]['table']}, will retry: {str(e)}")
+                failed.extend((op, e) for op in ops)
+            elif len(ops) == 1:
+                rejected.append((ops[0], e))
+            else:
+                middle = len(ops) // 2
+                self._send(ops[:middle], execute, failed, rejected)
+                self._send(ops[middle:], execute, failed, rejected)
+
+    def _requeue(self, failed, attempts):
+        with self._condition:
+            for op, _ in failed:
+                key = _op_key(op)
+                if op['op'] == 'insert':
+                    if key[2] in self._inserts[op['table']]:
+                        continue
+                    self._inserts[op['table']][key[2]] = op['row']
+                else:
+                    # Anything written since the failed flush is newer and wins.
+                    op = {**op, 'values': {**op['values'], **self._updates.get((op['table'], op['id']), {})}}
+                    self._updates[(op['table'], op['id'])] = op['values']
+                self._attempts[key] = attempts.get(key, 0) + 1
+                self._log({**op, 'attempts': self._attempts[key]})
+
+    def _dead_letter(self, rejected):
+        if not rejected:
+            return
+        with open(self.dead_letter_path, "a", encoding="utf-8") as dead:
+            for op, error in rejected:
+                print(f"Dropping buffered {op['op']} on {op['table']} after error: {str(error)}")
+                metrics.increment('write_buffer_dead_letters_total', table=op['table'], op=op['op'])
+                dead.write(json.dumps({**op, 'error': str(error), 'failed_at': datetime.now(timezone.utc).isoformat()}, default=str) + "\n")
+
+    def _claim_spill(self, base):
+        # The lock is held for the life of the process, so no two processes write the same spill file.
+        self._spill_base = base
+        for path in _spill_slots(base):
+            lock = _try_lock(path)
+            if lock is not None:
+                self._spill_lock = lock
+                return path
+        raise RuntimeError(f"No free write buffer spill file next to {base}")
+
+    def _recover(self):
+        # Replay a batch interrupted mid-flush, then anything logged after it, from this slot and
+        # from any slot whose process has gone away.
+        ops = 0
+        orphans = []
+        for slot in _spill_slots(self._spill_base):
+            if slot == self.spill_path or not any(os.path.exists(path) for path in (slot, slot + ".flushing")):
+                continue
+            lock = _try_lock(slot)
+            if lock is not None:
+                orphans.append((slot, lock))
+        paths = [self._flushing_path, self.spill_path] + [path for slot, _ in orphans for path in (slot + ".flushing", slot)]
+        for path in paths:
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding="utf-8") as spill:
+                for line in spill:
+                    if line.strip():
+                        try:
+                            self._apply(json.loads(line))
+                            ops += 1
+                        except ValueError:
+                            print(f"Skipping unreadable write buffer entry in {path}")
+        self._spill = open(self.spill_path, "w", encoding="utf-8")
+        for table, rows in self._inserts.items():
+            for ref, row in rows.items():
+                self._log({'op': 'insert', 'table': table, 'row': row, 'attempts': self._attempts.get(('insert', table, ref), 0)})
+        for (table, row_id), values in self._updates.items():
+            self._log({'op': 'update', 'table': table, 'id': row_id, 'values': values,
+                       'attempts': self._attempts.get(('update', table, row_id), 0)})
+        for path in [self._flushing_path] + paths[2:]:
+            if os.path.exists(path):
+                os.remove(path)
+        for _, lock in orphans:
+            lock.close()
+        if ops:
+            print(f"Recovered {ops} buffered writes from {self.spill_path}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if self._closed:
+                    return
+                if self._failures:
+                    # Back off while the database keeps failing, however full the buffer gets.
+                    self._condition.wait(min(FLUSH_MAX_BACKOFF_SECONDS, self.interval * 2 ** self._failures))
+                elif self._size() < self.max_rows:
+                    self._condition.wait(self.interval)
+                if self._closed:
+                    return
+            self.flush()
+
+def _spill_slots(base):
+    root, extension = os.path.splitext(base)
+    return [base] + [f"{root}.{slot}{extension}" for slot in range(1, WRITE_BUFFER_MAX_SLOTS)]
+
+def _try_lock(path):
+    lock = open(path + ".lock", "a")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return None
+    return lock
+
+def _timestamp(value):
+    # Sort key for ISO timestamps from the database and from pending rows; naive values are taken as UTC.
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def _op_key(op):
+    if op['op'] == 'insert':
+        return ('insert', op['table'], op['row'][INSERT_KEY])
+    return ('update', op['table'], op['id'])
+
+def _retryable(error):
+    # Bad data, constraint violations and schema errors (SQLSTATE classes 22, 23 and 42) and
+    # PostgREST's own request errors fail the same way every time. Anything else, such as network
+    # errors, timeouts and 5xx responses, may succeed on a later flush.
+    code = str(getattr(error, 'code', None) or '')
+    return not (code[:2] in ('22', '23', '42') or code.startswith('PGRST'))
+
+_write_buffer = None
+_write_buffer_lock = threading.Lock()
+
+def get_write_buffer():
+    global _write_buffer
+    with _write_buffer_lock:
+        if _write_buffer is None:
+            _write_buffer = WriteBehindBuffer(supabase_client)
+        return _write_buffer